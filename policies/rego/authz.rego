@@ -77,3 +77,10 @@ protocol_ok {
   input.request.protocol == "openid4vp"
   input.request.vc_dm_version == "2.0"
 }
+
+# Batch decisions: evaluates every input.requests[i] in one query.
+# Result maps the request index to its allow decision.
+batch_allow[i] = decision {
+  req := input.requests[i]
+  decision := allow with input as {"request": req}
+}
@@ -58,3 +58,18 @@ test_wallet_protocol_missing_denied {
   }}
   not data.compliance.authz.allow with input as input
 }
+
+test_batch_allow_per_item {
+  fields := ["control_id","policy_bundle_digest","release_id","environment_id","decision_id","timestamp"]
+  input := {"requests": [
+    {"endpoint": "wallet/verify", "purpose": "wallet_presentation", "requester_role": "verifier_service",
+     "retention_days": 1, "requested_claims": ["ageOver18"], "log_fields": fields,
+     "protocol": "openid4vp", "vc_dm_version": "2.0"},
+    {"endpoint": "wallet/verify", "purpose": "wallet_presentation", "requester_role": "verifier_service",
+     "retention_days": 1, "requested_claims": ["ageOver18","national_id"], "log_fields": fields,
+     "protocol": "openid4vp", "vc_dm_version": "2.0"}
+  ]}
+  res := data.compliance.authz.batch_allow with input as input
+  res[0] == true
+  res[1] == false
+}
@@ -1,10 +1,15 @@
-import json, hashlib
+import json, os, sys
 from pathlib import Path
 import pandas as pd
 import yaml
 
 ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from scripts.lib.bundles import release_digests
+from scripts.lib.rollups import open_store
 OUT = ROOT / "out"
+# Staleness table resolution in seconds (a rollup level); default is the finest level
+STALENESS_RES = int(os.environ["STALENESS_RES"]) if os.getenv("STALENESS_RES") else None
 TRACE = ROOT / "traceability" / "traceability.yaml"
 
 def read_json(path: Path):
@@ -15,13 +20,6 @@ def read_json(path: Path):
     except Exception:
         return None
 
-def sha256_file(p: Path) -> str:
-    h = hashlib.sha256()
-    with p.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024*1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
 def main():
     (OUT / "paper" / "tables").mkdir(parents=True, exist_ok=True)
     (OUT / "metrics").mkdir(parents=True, exist_ok=True)
@@ -58,10 +56,12 @@ def main():
         pivot = cat.pivot(index="release", columns="category", values="coverage_pct").fillna(0.0).round(2)
         (OUT / "paper" / "tables" / "rq1_category_coverage.tex").write_text(pivot.to_latex(float_format="%.2f"), encoding="utf-8")
 
+    store = open_store(OUT / "evidence")
     roll = read_json(OUT / "evidence" / "monitoring" / "rollup.json")
-    if roll and isinstance(roll.get("windows"), list):
+    windows = store.query(level=STALENESS_RES) if store is not None else (roll or {}).get("windows")
+    if isinstance(windows, list):
         st = []
-        for w in roll["windows"]:
+        for w in windows:
             st.append({
                 "window_start": w.get("window_start"),
                 "window_end": w.get("window_end"),
@@ -72,6 +72,7 @@ def main():
         pd.DataFrame(st).to_csv(OUT / "metrics" / "rq1_staleness.csv", index=False)
 
     deltas=[]
+    bundle_digests = release_digests()
     prev_bundle=None
     prev_findings=None
     for rel_dir in rel_dirs:
@@ -79,8 +80,7 @@ def main():
         findings = (ar.get("assessment-results", {}).get("results", [{}])[0].get("findings", [])) or []
         poam = read_json(rel_dir / "poam.json")
         poam_count = len((poam or {}).get("plan-of-action-and-milestones", {}).get("poam-items", []) or [])
-        btar = ROOT / "bundle" / "bundle.tar.gz"
-        bundle_digest = sha256_file(btar) if btar.exists() else None
+        bundle_digest = bundle_digests.get(rel_dir.name)
         deltas.append({
             "release": rel_dir.name,
             "bundle_digest": bundle_digest,
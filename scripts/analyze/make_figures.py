@@ -1,9 +1,13 @@
+import os, sys
 from pathlib import Path
 import pandas as pd
 import matplotlib.pyplot as plt
 
 ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from scripts.lib.rollups import open_store
 OUT = ROOT / "out"
+FIG_MAX_POINTS = int(os.getenv("FIG_MAX_POINTS", "200"))
 
 def main():
     figdir = OUT / "paper" / "figures"
@@ -81,6 +85,24 @@ def main():
         plt.savefig(figdir / "rq1_category_coverage_stacked.pdf")
         plt.close()
 
+    # Figure: monitoring latency percentiles at the finest rollup level that fits the plot
+    store = open_store(OUT / "evidence")
+    if store is not None:
+        windows = [w for w in store.query(max_points=FIG_MAX_POINTS) if w.get("lat_sketch")]
+        if windows:
+            x = [w["window_start"] for w in windows]
+            plt.figure()
+            for key, label in [("lat_ms_p50", "p50"), ("lat_ms_p95", "p95"), ("lat_ms_p99", "p99")]:
+                plt.plot(x, [w[key] for w in windows], marker="o", label=label)
+            res = windows[0]["window_end"] - windows[0]["window_start"]
+            plt.xlabel(f"Window start (epoch seconds, {res}s windows)")
+            plt.ylabel("Latency (ms)")
+            plt.title("Workload latency over time (merged window sketches)")
+            plt.legend()
+            plt.tight_layout()
+            plt.savefig(figdir / "monitoring_latency.pdf")
+            plt.close()
+
     print("Figures saved -> out/paper/figures/")
 
 if __name__ == "__main__":
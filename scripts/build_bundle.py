@@ -1,12 +1,9 @@
-import argparse, tarfile, json, time, shutil, hashlib
+import argparse, gzip, hashlib, io, json, re, sys, tarfile
 from pathlib import Path
 
-def sha256_file(p: Path) -> str:
-    h = hashlib.sha256()
-    with p.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024*1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from scripts.lib.bundles import BUNDLE_DIR, active_digest, append_ledger, find_build, publish, reactivate, read_ledger, record_release, store, store_path
 
 HIGH_ADDON = r'''
 # High complexity add-on: deny high risk unless compliance_service
@@ -21,13 +18,49 @@ allow {
 }
 '''
 
+# Tunable policy data is shipped as a bundle data document (data.compliance.config) instead
+# of a Rego constant, so changing it needs no policy recompile and can go out as an OPA delta
+# bundle (a patch.json against the running revision).
+CONFIG_PATH = "compliance/config/data.json"
+RETENTION_RE = re.compile(r"^retention_limit_days\s*=\s*(\d+)\s*$", re.M)
+RETENTION_FROM_DATA = """default retention_limit_days = \\1
+retention_limit_days = data.compliance.config.retention_limit_days"""
+
+# Deterministic .tar.gz: sorted entries, fixed mtime/uid/gid/mode and a zero gzip timestamp,
+# so identical inputs always produce byte-identical bundles (and the same digest)
+def write_tar(path: Path, files: dict[str, bytes]):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+        for name in sorted(files):
+            ti = tarfile.TarInfo(name)
+            ti.size = len(files[name])
+            ti.mtime, ti.uid, ti.gid, ti.uname, ti.gname, ti.mode = 0, 0, 0, "", "", 0o644
+            tar.addfile(ti, io.BytesIO(files[name]))
+    with path.open("wb") as f, gzip.GzipFile(filename="", mode="wb", fileobj=f, mtime=0) as gz:
+        gz.write(buf.getvalue())
+
+# Revision = hash of every input file (name and bytes), independent of build time
+def content_revision(files: dict[str, bytes]) -> str:
+    h = hashlib.sha256()
+    for name in sorted(files):
+        h.update(name.encode("utf-8") + b"\0" + hashlib.sha256(files[name]).digest())
+    return h.hexdigest()
+
+def file_hashes(files: dict[str, bytes]) -> dict[str, str]:
+    return {name: hashlib.sha256(b).hexdigest() for name, b in sorted(files.items())}
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--complexity", choices=["low","med","high"], default="med")
+    ap.add_argument("--retention-days", type=int, default=None, help="override retention_limit_days (bundle data)")
+    ap.add_argument("--delta", action="store_true",
+                    help="when only bundle data changed since the active bundle, also emit an OPA delta bundle")
+    ap.add_argument("--force", action="store_true", help="rebuild even if an identical bundle exists")
+    ap.add_argument("--release", default=None, help="also record this release_id -> digest in the ledger")
     args = ap.parse_args()
 
     root = Path(__file__).resolve().parents[1]
-    bundle_dir = root / "bundle"
+    bundle_dir = BUNDLE_DIR
     bundle_dir.mkdir(exist_ok=True)
 
     authz_src = (root / "policies/rego/authz.rego").read_text(encoding="utf-8")
@@ -47,25 +80,57 @@ def main():
         f"min_allowed_claims = {min_set}  # complexity={args.complexity}"
     ) + "\n" + addon + "\n"
 
-    tmp = root / ".tmp_bundle"
-    if tmp.exists():
-        shutil.rmtree(tmp)
-    (tmp / "policies").mkdir(parents=True)
+    m = RETENTION_RE.search(authz_src)
+    if not m:
+        raise SystemExit("policies/rego/authz.rego: no `retention_limit_days = <days>` literal")
+    config = {"retention_limit_days": args.retention_days if args.retention_days is not None else int(m.group(1))}
+    authz_src = RETENTION_RE.sub(RETENTION_FROM_DATA, authz_src, count=1)
 
-    (tmp / "policies" / "authz.rego").write_text(authz_src, encoding="utf-8")
-    (tmp / "policies" / "data.rego").write_text((root / "policies/rego/data.rego").read_text(encoding="utf-8"), encoding="utf-8")
+    files = {
+        "policies/authz.rego": authz_src.encode("utf-8"),
+        "policies/data.rego": (root / "policies/rego/data.rego").read_bytes(),
+        CONFIG_PATH: json.dumps(config, sort_keys=True).encode("utf-8"),
+    }
+    revision = content_revision(files)
+    policy_hashes = {k: v for k, v in file_hashes(files).items() if k.startswith("policies/")}
 
-    manifest = {"revision": f"{int(time.time())}", "roots": ["compliance"]}
-    (tmp / ".manifest").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    ledger = read_ledger()
+    prev = find_build(ledger, revision=revision)
+    if prev and store_path(prev["digest"]).exists() and not args.force:
+        if active_digest(ledger) != prev["digest"]:
+            reactivate(prev["digest"])
+        digest = prev["digest"]
+        print(f"Bundle unchanged (revision {revision[:12]}): {store_path(digest)} sha256={digest}")
+    else:
+        base = find_build(ledger, digest=active_digest(ledger))
+        manifest = {"revision": revision, "roots": ["compliance"]}
+        out_tar = bundle_dir / "bundle.build.tar.gz"
+        write_tar(out_tar, {**files, ".manifest": json.dumps(manifest, indent=2).encode("utf-8")})
+        digest = store(out_tar)
+        # the delta is in the ledger before the bundle goes live, so servers see both together
+        if args.delta:
+            emit_delta(base, digest, revision, policy_hashes, config)
+        publish(digest, complexity=args.complexity, revision=revision, policies=policy_hashes, config=config)
+        print(f"Built bundle: {store_path(digest)} sha256={digest}")
 
-    out_tar = bundle_dir / "bundle.tar.gz"
-    with tarfile.open(out_tar, "w:gz") as tar:
-        tar.add(tmp / ".manifest", arcname=".manifest")
-        tar.add(tmp / "policies", arcname="policies")
+    if args.release:
+        record_release(args.release, digest)
 
-    digest = sha256_file(out_tar)
-    (bundle_dir / "bundle.sha256").write_text(digest + "  bundle.tar.gz\n", encoding="utf-8")
-    print(f"Built bundle: {out_tar} sha256={digest}")
+# OPA delta bundle from the previously active build to this one, when only data changed
+def emit_delta(base, digest: str, revision: str, policy_hashes: dict, config: dict):
+    if not base or "config" not in base or base.get("policies") != policy_hashes:
+        print("No delta bundle: policies changed (or no comparable active bundle); the full bundle applies")
+        return
+    ops = [{"op": "upsert", "path": f"/compliance/config/{k}", "value": v}
+           for k, v in sorted(config.items()) if base["config"].get(k) != v]
+    manifest = {"revision": revision, "roots": ["compliance"]}
+    tmp = BUNDLE_DIR / "delta.build.tar.gz"
+    write_tar(tmp, {".manifest": json.dumps(manifest, indent=2).encode("utf-8"),
+                    "patch.json": json.dumps({"data": ops}, sort_keys=True).encode("utf-8")})
+    ddigest = store(tmp)
+    append_ledger({"type": "delta", "digest": ddigest, "bytes": store_path(ddigest).stat().st_size, "base": base["digest"],
+                   "base_revision": base.get("revision"), "target": digest, "revision": revision, "ops": len(ops)})
+    print(f"Delta bundle: {store_path(ddigest)} ({len(ops)} ops, base {base['digest'][:12]})")
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,9 @@
-import json, time, os
+import json, time, os, sys
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from scripts.lib.bundles import active_digest, record_release
 OUT = ROOT / "out"
 EVID = OUT / "evidence"
 CDDIR = EVID / "cd_gates"
@@ -19,7 +21,7 @@ def main():
     release = os.getenv("RELEASE_ID","r1")
     env = os.getenv("ENVIRONMENT_ID","dev")
 
-    bundle_sha = (ROOT / "bundle" / "bundle.sha256").read_text(encoding="utf-8").strip() if (ROOT / "bundle" / "bundle.sha256").exists() else None
+    bundle_sha = active_digest()
     ci_opa = read_json(EVID / "ci_reports" / "opa_test.json")
     ci_conf = read_json(EVID / "ci_reports" / "conftest.json")
 
@@ -44,6 +46,9 @@ def main():
         "bundle_sha256": bundle_sha,
         "ts": time.time()
     }
+    if bundle_sha:
+        # the release ships with the active bundle; the ledger keeps that binding for later analysis
+        record_release(release, bundle_sha, environment_id=env, gate_ok=ok)
     p = CDDIR / f"cd_gate_{release}_{int(time.time())}.json"
     p.write_text(json.dumps(gate, indent=2), encoding="utf-8")
     print(f"CD gate {release}: ok={ok} reasons={reasons}")
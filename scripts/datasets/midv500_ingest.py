@@ -1,14 +1,11 @@
-import argparse, json, hashlib
+import argparse, json, sys
 from pathlib import Path
 
 VIDEO_EXTS = {".mp4",".avi",".mov",".mkv",".webm",".mpg",".mpeg",".m4v"}
 
-def sha256_file(p: Path) -> str:
-    h = hashlib.sha256()
-    with p.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024*1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from scripts.lib.hashcache import sha256_file
 
 def main():
     ap = argparse.ArgumentParser()
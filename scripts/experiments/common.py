@@ -1,8 +1,12 @@
 from pathlib import Path
-import json, hashlib, time
+import json, os, time, urllib.error, urllib.request
+
+from scripts.lib.bundles import active_digest
+from scripts.lib.hashcache import sha256_file
 
 ROOT = Path(__file__).resolve().parents[2]
 OUT = ROOT / "out"
+BUNDLE_SERVER_URL = os.getenv("BUNDLE_SERVER_URL", "http://localhost:8888")
 
 def ensure_dirs():
     (OUT / "metrics").mkdir(parents=True, exist_ok=True)
@@ -16,9 +20,20 @@ def ensure_dirs():
 def write_meta(meta: dict):
     (OUT / "metadata" / "experiment_meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
 
-def sha256_file(p: Path) -> str:
-    h = hashlib.sha256()
-    with p.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024*1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+# Block until OPA reports the active bundle (or `digest`) activated, via the bundle server's
+# /activation endpoint; falls back to the old fixed sleep if the server cannot be reached
+def wait_bundle_active(digest: str | None = None, timeout: float = 30.0) -> dict | None:
+    digest = digest or active_digest()
+    url = f"{BUNDLE_SERVER_URL}/activation?timeout={timeout}" + (f"&digest={digest}" if digest else "")
+    try:
+        with urllib.request.urlopen(url, timeout=timeout + 5) as r:
+            res = json.loads(r.read())
+        print(f"Bundle {res['revision'][:12]} active after {res['waited_ms']:.0f} ms")
+        return res
+    except urllib.error.HTTPError as ex:
+        print(f"bundle {digest} not confirmed active within {timeout}s: {ex.read().decode(errors='replace')}")
+        return None
+    except OSError as ex:
+        print(f"bundle server unreachable ({ex}); sleeping 2s instead")
+        time.sleep(2)
+        return None
@@ -1,7 +1,7 @@
 import os, sys, time, json, subprocess
 from pathlib import Path
 
-from scripts.experiments.common import ensure_dirs, write_meta
+from scripts.experiments.common import ensure_dirs, wait_bundle_active, write_meta
 
 ROOT = Path(__file__).resolve().parents[2]
 OUT = ROOT / "out"
@@ -26,7 +26,7 @@ def load_workloads(seed, n=2000, conc=50):
     run([sys.executable,"scripts/loadgen.py"], env={**env, "WORKLOAD":"wallet"})
 
 def summarize_windows():
-    run([sys.executable,"scripts/monitoring/window_summarizer.py"], env={"WINDOW_SEC":"60"})
+    run([sys.executable,"scripts/monitoring/window_summarizer.py"], env={"WINDOW_SEC":"60", "WINDOW_INCREMENTAL":"1"})
 
 def main():
     ensure_dirs()
@@ -40,8 +40,7 @@ def main():
     for i, rel in enumerate(releases):
         if rel == "r2":
             run([sys.executable,"scripts/build_bundle.py","--complexity", os.getenv("POLICY_COMPLEXITY","med")])
-            run(["docker","compose","restart","opa"])
-            time.sleep(2)
+            wait_bundle_active()
 
         run(["docker","compose","up","-d","--no-deps","--build","identity-api"], env={"RELEASE_ID": rel})
         time.sleep(2)
@@ -3,7 +3,8 @@ from pathlib import Path
 
 import pandas as pd
 
-from scripts.experiments.common import ensure_dirs, write_meta
+from scripts.experiments.common import ensure_dirs, wait_bundle_active, write_meta
+from scripts.lib.evidence import stream_bytes
 
 ROOT = Path(__file__).resolve().parents[2]
 OUT = ROOT / "out"
@@ -48,10 +49,9 @@ def main():
         "ts": time.time()
     })
 
-    # Ensure bundle exists and OPA reloads it
+    # Ensure bundle exists and OPA has activated it
     run([sys.executable, "scripts/build_bundle.py", "--complexity", policy_complexity])
-    run(["docker", "compose", "restart", "opa"])
-    time.sleep(2)
+    wait_bundle_active()
 
     modes = [("baseline", "1"), ("enforced", "0")]
     rows = []
@@ -70,6 +70,7 @@ def main():
 
         sp = find_wallet_summary(n, conc)
         summ = json.loads(sp.read_text(encoding="utf-8"))
+        summ.pop("lat_sketch", None)
         summ["mode"] = mode
         rows.append(summ)
 
@@ -80,14 +81,11 @@ def main():
     # Evidence volume (very simple proxy)
     evid = OUT / "evidence"
 
-    def sz(p: Path) -> int:
-        return int(p.stat().st_size) if p.exists() else 0
-
     vol_rows = [
         {"metric": "N", "value": n},
         {"metric": "CONC", "value": conc},
-        {"metric": "opa_decisions_bytes", "value": sz(evid / "opa_decisions.jsonl")},
-        {"metric": "events_bytes", "value": sz(evid / "events.jsonl")},
+        {"metric": "opa_decisions_bytes", "value": stream_bytes(evid, "opa_decisions")},
+        {"metric": "events_bytes", "value": stream_bytes(evid, "events")},
     ]
     vol_df = pd.DataFrame(vol_rows)
     (OUT / "metrics" / "rq3_evidence_volume.csv").write_text(vol_df.to_csv(index=False), encoding="utf-8")
@@ -1,37 +1,29 @@
-import json, os, time, hashlib
+import json, os, re, sys, time, hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import yaml
 
 ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from scripts.lib.bundles import release_digests, store_path
+from scripts.lib.chain import checkpoints_path, latest_checkpoint
+from scripts.lib.evidence import list_segments, physical_streams
+from scripts.lib.control_index import empty_entry, head_ts, update_index
+from scripts.lib.hashcache import sha256_file
 OUT = ROOT / "out"
 EVID = OUT / "evidence"
 TRACE = ROOT / "traceability" / "traceability.yaml"
-
-def sha256_file(p: Path) -> str:
-    h = hashlib.sha256()
-    with p.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024*1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+# Controls whose newest evidence is more than this many seconds behind the newest evidence
+# overall are reported as stale (unset: no age check)
+MAX_AGE_SEC = float(os.environ["EVIDENCE_MAX_AGE_SEC"]) if os.getenv("EVIDENCE_MAX_AGE_SEC") else None
+HASH_WORKERS = int(os.getenv("OSCAL_HASH_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Digests come from the shared hash cache (scripts/lib/hashcache.py), which trusts stat data
+# and resumes append-only streams; --rehash / OSCAL_FULL_REHASH=1 rereads every cited file
+FULL_REHASH = os.getenv("OSCAL_FULL_REHASH", "0") == "1"
 
 def load_trace():
     return yaml.safe_load(TRACE.read_text(encoding="utf-8"))
 
-def read_jsonl(path: Path):
-    if not path.exists():
-        return []
-    out=[]
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line=line.strip()
-            if not line:
-                continue
-            try:
-                out.append(json.loads(line))
-            except Exception:
-                pass
-    return out
-
 def read_json(path: Path):
     if not path.exists():
         return None
@@ -40,33 +32,63 @@ def read_json(path: Path):
     except Exception:
         return None
 
-def export_release(release_id: str):
-    rel_dir = OUT / "oscal" / release_id
-    rel_dir.mkdir(parents=True, exist_ok=True)
-    trace = load_trace()
-
-    decision_log = EVID / "opa_decisions.jsonl"
-    events_log = EVID / "events.jsonl"
+# Back-matter resources for the current evidence. Files are collected first and the distinct
+# ones hashed on a thread pool (the hash cache skips unchanged files entirely).
+def collect_resources(pool: ThreadPoolExecutor) -> list[dict]:
     ci_dir = EVID / "ci_reports"
     mon_rollup = EVID / "monitoring" / "rollup.json"
     cd_dir = EVID / "cd_gates"
 
     resources = []
-    def add_res(title: str, p: Path):
+    pending = []
+    def add_res(title: str, p: Path, digest: str | None = None, append_only: bool = False):
         if not p.exists():
             return
-        resources.append({
+        res = {
             "uuid": hashlib.sha256(str(p).encode()).hexdigest()[:32],
             "title": title,
             "rlinks": [{
                 "href": str(p.relative_to(ROOT)),
-                "hashes": [{"algorithm":"sha-256","value": sha256_file(p)}]
+                "hashes": [{"algorithm":"sha-256","value": digest}]
             }]
+        }
+        resources.append(res)
+        if digest is None:
+            pending.append((res, p, append_only))
+
+    # Streams with a collector hash chain are cited by checkpoint root + range instead of a full rehash
+    def add_chain_res(title: str, stream: str, cp: dict):
+        p = checkpoints_path(EVID, stream)
+        resources.append({
+            "uuid": hashlib.sha256(f"chain:{stream}".encode()).hexdigest()[:32],
+            "title": title,
+            "props": [
+                {"name": "evidence-chain-stream", "value": stream},
+                {"name": "evidence-chain-root", "value": cp["root"]},
+                {"name": "evidence-chain-checkpoint", "value": str(cp["seq"])},
+                {"name": "evidence-chain-records", "value": f"0-{cp['records']}"},
+                {"name": "evidence-chain-bytes", "value": f"0-{cp['bytes']}"}
+            ],
+            "rlinks": [{"href": str(p.relative_to(ROOT))}]
         })
 
-    add_res("OPA decision logs", decision_log)
-    add_res("Workload events", events_log)
+    # a sharded (multi-worker) stream is cited shard by shard; together they are the logical stream
+    for base, title in [("opa_decisions", "OPA decision logs"), ("events", "Workload events")]:
+        for stream in physical_streams(EVID, base):
+            label = title if stream == base else f"{title} shard {stream}"
+            cp = latest_checkpoint(EVID, stream)
+            if cp:
+                add_chain_res(f"{label} (hash chain)", stream, cp)
+            else:
+                add_res(label, EVID / f"{stream}.jsonl", append_only=True)
+            # closed segments carry their sha256 in the sidecar manifest; only the active one is hashed
+            for seg in list_segments(EVID, stream):
+                m = seg["manifest"] or {}
+                add_res(f"{label} segment {seg['path'].name}", seg["path"], m.get("sha256"), append_only=True)
     add_res("Monitoring rollup", mon_rollup)
+    # policy bundles deployed with any release, cited by the digest recorded when they were built
+    for digest in sorted(set(release_digests().values())):
+        add_res(f"Policy bundle {digest[:12]}", store_path(digest), digest)
 
     if ci_dir.exists():
         for p in ci_dir.glob("*.json"):
@@ -75,7 +97,63 @@ def export_release(release_id: str):
         for p in cd_dir.glob("*.json"):
             add_res(f"CD gate {p.name}", p)
 
-    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    digests = {}
+    for p, append_only in {(p, a) for _, p, a in pending}:
+        digests[p] = pool.submit(sha256_file, p, append_only, FULL_REHASH)
+    for res, p, _ in pending:
+        res["rlinks"][0]["hashes"][0]["value"] = digests[p].result()
+    return resources
+
+# Release-independent evidence facts used by every release's assessment
+def collect_facts() -> dict:
+    ci_dir = EVID / "ci_reports"
+    roll = read_json(EVID / "monitoring" / "rollup.json")
+    missing_window_flag = False
+    if roll and isinstance(roll.get("windows"), list):
+        for w in roll["windows"]:
+            if w.get("missing_core_controls"):
+                missing_window_flag = True
+                break
+
+    ci_fail = False
+    if ci_dir.exists():
+        for p in ["opa_test.json","conftest.json"]:
+            j = read_json(ci_dir / p) or {}
+            if j and j.get("returncode", 0) != 0:
+                ci_fail = True
+                break
+
+    return {
+        "trace": load_trace(),
+        "bundles": release_digests(),
+        "index": update_index(EVID),
+        "missing_window_flag": missing_window_flag,
+        "ci_fail": ci_fail,
+    }
+
+# json.dumps(doc, indent=2) with the shared back-matter resources rendered once and spliced in
+RESOURCES_MARK = "__oscal_resources__"
+def dumps_with_resources(doc: dict, rendered: str) -> str:
+    text = json.dumps(doc, indent=2)
+    i = text.index(f'"{RESOURCES_MARK}"')
+    indent = text[text.rindex("\n", 0, i) + 1:i]
+    indent = indent[:len(indent) - len(indent.lstrip(" "))]
+    return text[:i] + rendered.replace("\n", "\n" + indent) + text[i + len(RESOURCES_MARK) + 2:]
+
+def export_release(release_id: str, resources: list[dict] | None = None, facts: dict | None = None,
+                   rendered: str | None = None, now: str | None = None):
+    rel_dir = OUT / "oscal" / release_id
+    rel_dir.mkdir(parents=True, exist_ok=True)
+    if resources is None:
+        with ThreadPoolExecutor(HASH_WORKERS) as pool:
+            resources = collect_resources(pool)
+    facts = facts or collect_facts()
+    rendered = rendered if rendered is not None else json.dumps(resources, indent=2)
+    trace = facts["trace"]
+    bundle = facts["bundles"].get(release_id)
+    cd_dir = EVID / "cd_gates"
+
+    now = now or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
 
     compdef = {
         "component-definition": {
@@ -83,14 +161,15 @@ def export_release(release_id: str):
             "metadata": {"title": f"EviID Component Definition ({release_id})", "last-modified": now},
             "components": [
                 {"uuid": "identity-api", "type": "service", "title": "Identity API"},
-                {"uuid": "opa-pdp", "type": "service", "title": "OPA PDP"},
+                {"uuid": "opa-pdp", "type": "service", "title": "OPA PDP",
+                 **({"props": [{"name": "policy-bundle-sha256", "value": bundle}]} if bundle else {})},
                 {"uuid": "collector", "type": "service", "title": "Evidence Collector"},
                 {"uuid": "oscal-exporter", "type": "tool", "title": "OSCAL Exporter"}
             ],
-            "back-matter": {"resources": resources}
+            "back-matter": {"resources": RESOURCES_MARK}
         }
     }
-    (rel_dir / "component-definition.json").write_text(json.dumps(compdef, indent=2), encoding="utf-8")
+    (rel_dir / "component-definition.json").write_text(dumps_with_resources(compdef, rendered), encoding="utf-8")
 
     ssp = {
         "system-security-plan": {
@@ -98,22 +177,14 @@ def export_release(release_id: str):
             "metadata": {"title": f"EviID SSP ({release_id})", "last-modified": now},
             "system-characteristics": {"system-name": "EviID Prototype", "description": "Research prototype for compliance-as-code evidence generation."},
             "import-profile": {"href": "profile://identity"},
-            "back-matter": {"resources": resources}
+            "back-matter": {"resources": RESOURCES_MARK}
         }
     }
-    (rel_dir / "system-security-plan.json").write_text(json.dumps(ssp, indent=2), encoding="utf-8")
+    (rel_dir / "system-security-plan.json").write_text(dumps_with_resources(ssp, rendered), encoding="utf-8")
 
-    decisions = read_jsonl(decision_log)
-    del_dir = EVID / "deletions"
-    has_del = del_dir.exists() and any(del_dir.glob("*.json"))
-
-    roll = read_json(mon_rollup)
-    missing_window_flag = False
-    if roll and isinstance(roll.get("windows"), list):
-        for w in roll["windows"]:
-            if w.get("missing_core_controls"):
-                missing_window_flag = True
-                break
+    index = facts["index"]
+    head = head_ts(index)
+    missing_window_flag, ci_fail = facts["missing_window_flag"], facts["ci_fail"]
 
     cd_fail = False
     if cd_dir.exists():
@@ -123,28 +194,35 @@ def export_release(release_id: str):
                 cd_fail = True
                 break
 
-    ci_fail = False
-    if ci_dir.exists():
-        for p in ["opa_test.json","conftest.json"]:
-            j = read_json(ci_dir / p) or {}
-            if j and j.get("returncode", 0) != 0:
-                ci_fail = True
-                break
-
     findings=[]
     observations=[]
     required_controls = [c["cid"] for c in trace["controls"]]
 
     for cid in required_controls:
-        ok = bool(decisions)
+        entry = index["controls"].get(cid) or empty_entry()
+        ok = entry["sources"].get("opa_decisions", 0) > 0
         if cid == "ID-RET-01":
-            ok = ok and has_del
+            ok = ok and entry["sources"].get("deletions", 0) > 0
         if cid in ["ID-LOG-01","ID-PUR-01","ID-ACC-01"] and missing_window_flag:
             ok = False
+        stale = MAX_AGE_SEC is not None and entry["last_ts"] is not None and head - entry["last_ts"] > MAX_AGE_SEC
+        if stale:
+            ok = False
 
+        props = [{"name": "evidence-count", "value": str(entry["count"])}]
+        props += [{"name": f"evidence-{k.replace('_', '-')}", "value": str(n)} for k, n in sorted(entry["sources"].items())]
+        for k in ("first_ts", "last_ts"):
+            if entry[k] is not None:
+                props.append({"name": f"evidence-{k.replace('_ts', '')}-seen",
+                              "value": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(entry[k]))})
+        if entry["releases"]:
+            props.append({"name": "evidence-releases", "value": ",".join(sorted(entry["releases"]))})
+        if stale:
+            props.append({"name": "evidence-stale", "value": "true"})
         observations.append({
             "uuid": hashlib.sha256(f"obs:{release_id}:{cid}".encode()).hexdigest()[:32],
             "description": f"Evidence present={ok} for control {cid}",
+            "props": props,
             "subjects": [{"type":"control","title": cid}]
         })
         if not ok:
@@ -174,10 +252,10 @@ def export_release(release_id: str):
                 "observations": observations,
                 "findings": findings
             }],
-            "back-matter": {"resources": resources}
+            "back-matter": {"resources": RESOURCES_MARK}
         }
     }
-    (rel_dir / "assessment-results.json").write_text(json.dumps(ar, indent=2), encoding="utf-8")
+    (rel_dir / "assessment-results.json").write_text(dumps_with_resources(ar, rendered), encoding="utf-8")
 
     if findings:
         poam = {
@@ -188,17 +266,54 @@ def export_release(release_id: str):
                     "uuid": f["uuid"], "title": f["title"], "description": f["description"],
                     "status": {"state": "open"}
                 } for f in findings],
-                "back-matter": {"resources": resources}
+                "back-matter": {"resources": RESOURCES_MARK}
             }
         }
-        (rel_dir / "poam.json").write_text(json.dumps(poam, indent=2), encoding="utf-8")
+        (rel_dir / "poam.json").write_text(dumps_with_resources(poam, rendered), encoding="utf-8")
 
     return rel_dir
 
+# Export several releases against the same evidence: files are hashed once, the resources
+# are rendered once, and the releases' documents are written on a thread pool.
+def export_releases(release_ids: list[str], workers: int = HASH_WORKERS) -> list[Path]:
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        resources = collect_resources(pool)
+        facts = collect_facts()
+        rendered = json.dumps(resources, indent=2)
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        futs = [pool.submit(export_release, r, resources, facts, rendered, now) for r in release_ids]
+        return [f.result() for f in futs]
+
+# "r1,r3" or "r1..r4" (a range keeps the prefix and steps the trailing number)
+def parse_releases(spec: str) -> list[str]:
+    out = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ".." in part:
+            lo, hi = part.split("..", 1)
+            m_lo, m_hi = re.fullmatch(r"(.*?)(\d+)", lo), re.fullmatch(r"(.*?)(\d+)", hi)
+            if not m_lo or not m_hi or (m_hi.group(1) and m_hi.group(1) != m_lo.group(1)):
+                raise ValueError(f"bad release range {part!r}")
+            out += [f"{m_lo.group(1)}{n}" for n in range(int(m_lo.group(2)), int(m_hi.group(2)) + 1)]
+        else:
+            out.append(part)
+    return list(dict.fromkeys(out))
+
 if __name__ == "__main__":
     import argparse
     ap = argparse.ArgumentParser()
     ap.add_argument("--release", default=os.getenv("RELEASE_ID","r1"))
+    ap.add_argument("--releases", default=os.getenv("RELEASES"), help="comma list and/or ranges, e.g. r1..r12,hotfix1")
+    ap.add_argument("--workers", type=int, default=HASH_WORKERS)
+    ap.add_argument("--rehash", action="store_true", default=FULL_REHASH, help="reread every cited file instead of trusting the hash cache")
     args = ap.parse_args()
-    d = export_release(args.release)
-    print(f"Exported OSCAL for {args.release} -> {d}")
+    FULL_REHASH = args.rehash
+    if args.releases:
+        releases = parse_releases(args.releases)
+        for r, d in zip(releases, export_releases(releases, args.workers)):
+            print(f"Exported OSCAL for {r} -> {d}")
+    else:
+        d = export_release(args.release)
+        print(f"Exported OSCAL for {args.release} -> {d}")
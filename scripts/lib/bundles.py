@@ -0,0 +1,104 @@
+import json, os, shutil, time
+from pathlib import Path
+
+from scripts.lib.hashcache import sha256_path
+
+# Content-addressed store for OPA policy bundles:
+#   bundle/sha256/<digest>.tar.gz  every bundle ever published, named by its sha256
+#   bundle/bundle.tar.gz           the active bundle (a link to its store entry), what OPA polls
+#   bundle/bundle.sha256           digest of the active bundle
+#   bundle/ledger.jsonl            append-only: {"type": "build", ...} per published bundle,
+#                                  {"type": "activate", "digest"} when an earlier build is reused,
+#                                  {"type": "delta", "digest", "base", ...} per OPA delta bundle and
+#                                  {"type": "release", "release_id", "digest", ...} per deployed release
+# Digests are computed once, when a bundle is published; readers take them from the ledger.
+ROOT = Path(__file__).resolve().parents[2]
+BUNDLE_DIR = ROOT / "bundle"
+STORE = BUNDLE_DIR / "sha256"
+LEDGER = BUNDLE_DIR / "ledger.jsonl"
+ACTIVE = BUNDLE_DIR / "bundle.tar.gz"
+
+def store_path(digest: str) -> Path:
+    return STORE / f"{digest}.tar.gz"
+
+def append_ledger(entry: dict):
+    BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+    with LEDGER.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def read_ledger() -> list[dict]:
+    if not LEDGER.exists():
+        return []
+    out = []
+    with LEDGER.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out.append(json.loads(line))
+            except Exception:
+                pass
+    return out
+
+# Move a tarball into the store (a no-op for content already there) and return its digest
+def store(tar_path: Path) -> str:
+    digest = sha256_path(tar_path)
+    STORE.mkdir(parents=True, exist_ok=True)
+    dst = store_path(digest)
+    if dst.exists():
+        tar_path.unlink()
+    else:
+        os.replace(tar_path, dst)
+    return digest
+
+# Point bundle.tar.gz and bundle.sha256 at a stored bundle
+def activate(digest: str):
+    dst = store_path(digest)
+    tmp = ACTIVE.with_name(ACTIVE.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        os.link(dst, tmp)
+    except OSError:
+        shutil.copyfile(dst, tmp)
+    os.replace(tmp, ACTIVE)
+    (BUNDLE_DIR / "bundle.sha256").write_text(digest + "  bundle.tar.gz\n", encoding="utf-8")
+
+# Make a stored bundle the active one and record the build
+def publish(digest: str, **meta) -> str:
+    activate(digest)
+    append_ledger({"type": "build", "digest": digest, "bytes": store_path(digest).stat().st_size, "ts": time.time(), **meta})
+    return digest
+
+# Make an earlier build active again without rebuilding it
+def reactivate(digest: str):
+    activate(digest)
+    append_ledger({"type": "activate", "digest": digest, "ts": time.time()})
+
+# Newest build entry with the given field values, e.g. find_build(revision=...)
+def find_build(ledger: list[dict] | None = None, **match):
+    for e in reversed(read_ledger() if ledger is None else ledger):
+        if e.get("type") == "build" and all(e.get(k) == v for k, v in match.items()):
+            return e
+    return None
+
+# Digest of the active bundle: the newest build or activation in the ledger, else the legacy bundle.sha256
+def active_digest(ledger: list[dict] | None = None):
+    active = [e for e in (read_ledger() if ledger is None else ledger) if e.get("type") in ("build", "activate")]
+    if active:
+        return active[-1]["digest"]
+    p = BUNDLE_DIR / "bundle.sha256"
+    fields = p.read_text(encoding="utf-8").split() if p.exists() else []
+    return fields[0] if fields else None
+
+def record_release(release_id: str, digest: str, **meta):
+    append_ledger({"type": "release", "release_id": release_id, "digest": digest, "ts": time.time(), **meta})
+
+# release_id -> digest, the latest record for each release
+def release_digests(ledger: list[dict] | None = None) -> dict[str, str]:
+    out = {}
+    for e in read_ledger() if ledger is None else ledger:
+        if e.get("type") == "release":
+            out[e["release_id"]] = e["digest"]
+    return out
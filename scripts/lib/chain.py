@@ -0,0 +1,66 @@
+import hashlib, json
+from pathlib import Path
+
+from scripts.lib.evidence import stream_files
+
+# Verifier side of the collector's per-stream hash chain (services/collector/app/chain.py):
+#   root_0 = GENESIS, root_i = sha256(root_{i-1} || sha256(line_i))
+GENESIS = "0" * 64
+
+def chain_step(root: str, line: bytes) -> str:
+    return hashlib.sha256(bytes.fromhex(root) + hashlib.sha256(line).digest()).hexdigest()
+
+def checkpoints_path(evid: Path, stream: str) -> Path:
+    return evid / "chain" / f"{stream}.checkpoints.jsonl"
+
+def load_checkpoints(evid: Path, stream: str) -> list[dict]:
+    p = checkpoints_path(evid, stream)
+    if not p.exists():
+        return []
+    out = []
+    with p.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out.append(json.loads(line))
+            except Exception:
+                pass
+    return out
+
+def latest_checkpoint(evid: Path, stream: str):
+    cps = load_checkpoints(evid, stream)
+    return cps[-1] if cps else None
+
+# Re-chain the records between two checkpoints (start=None means from genesis).
+# Only the bytes after `start` are read, so verifying each new checkpoint is O(new evidence).
+def verify_range(evid: Path, stream: str, start: dict | None, end: dict) -> dict:
+    root = start["root"] if start else GENESIS
+    records = start["records"] if start else 0
+    nbytes = 0
+    files = stream_files(evid, stream)
+    names = [p.name for p in files]
+    idx = 0
+    if start:
+        if start["file"] in names:
+            idx = names.index(start["file"])
+        else:
+            idx = next((i for i, n in enumerate(names) if n >= start["file"]), len(names))
+    for p in files[idx:]:
+        if records >= end["records"]:
+            break
+        with p.open("rb") as f:
+            if start and p.name == start["file"]:
+                f.seek(start.get("file_offset", 0))
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written tail
+                root = chain_step(root, line)
+                records += 1
+                nbytes += len(line)
+                if records >= end["records"]:
+                    break
+    ok = records == end["records"] and root == end["root"]
+    return {"ok": ok, "records": records, "expected_records": end["records"], "root": root,
+            "expected_root": end["root"], "bytes_read": nbytes}
@@ -0,0 +1,113 @@
+import json, os
+from pathlib import Path
+
+from scripts.lib.evidence import iter_jsonl_from, logical_stream_files, record_ts
+
+# Per-control evidence index, built incrementally like the window summarizer's checkpoint:
+# only decision-log bytes appended since the last update (and deletion files not seen before)
+# are read. For every control ID it keeps
+#   {"count", "first_ts", "last_ts", "releases": {release_id: n}, "sources": {source: n}}
+# where an authz decision counts toward the controls its endpoint enforces and a deletion job
+# counts toward ID-RET-01. Other OPA queries in the decision log are not evidence and are only
+# counted as skipped. Stored in evidence/index/controls.json.
+INDEX_VERSION = 2
+SOURCES = ("opa_decisions", "deletions")
+AUTHZ_PATHS = ("compliance/authz/allow", "compliance/authz/batch_allow")
+
+def index_path(evid: Path) -> Path:
+    return evid / "index" / "controls.json"
+
+def controls_for_endpoint(endpoint) -> set[str]:
+    base = {"ID-LOG-01","ID-PUR-01","ID-ACC-01"}
+    if endpoint == "wallet/verify":
+        base.add("ID-MIN-01")
+    if endpoint == "onboarding/process":
+        base.add("ID-RET-01")
+    return base
+
+def empty_entry() -> dict:
+    return {"count": 0, "first_ts": None, "last_ts": None, "releases": {}, "sources": {s: 0 for s in SOURCES}}
+
+def _note(entry: dict, source: str, ts, release_id, n: int = 1):
+    entry["count"] += n
+    entry["sources"][source] = entry["sources"].get(source, 0) + n
+    if ts is not None:
+        entry["first_ts"] = ts if entry["first_ts"] is None else min(entry["first_ts"], ts)
+        entry["last_ts"] = ts if entry["last_ts"] is None else max(entry["last_ts"], ts)
+    if release_id:
+        entry["releases"][release_id] = entry["releases"].get(release_id, 0) + n
+
+# (endpoint, release_id) per request in an authz decision (batch decisions carry one per item);
+# empty for any other query and for requests without an endpoint
+def decision_requests(rec: dict):
+    if not isinstance(rec, dict) or str(rec.get("path") or "").removeprefix("/").removeprefix("v1/data/") not in AUTHZ_PATHS:
+        return []
+    inp = rec.get("input")
+    if not isinstance(inp, dict):
+        return []
+    reqs = inp.get("requests") if isinstance(inp.get("requests"), list) else [inp.get("request")]
+    return [(r["endpoint"], r.get("release_id")) for r in reqs if isinstance(r, dict) and r.get("endpoint")]
+
+def load_index(evid: Path):
+    p = index_path(evid)
+    try:
+        idx = json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if idx.get("version") != INDEX_VERSION:
+        return None
+    # a tracked file that shrank or vanished was rewritten: start over
+    if not all((evid / k).exists() and (evid / k).stat().st_size >= off for k, off in idx["offsets"].items()):
+        return None
+    return idx
+
+def save_index(evid: Path, idx: dict):
+    p = index_path(evid)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(idx), encoding="utf-8")
+    os.replace(tmp, p)
+
+# Bring the index up to date with the evidence on disk and return it
+def update_index(evid: Path) -> dict:
+    idx = load_index(evid) or {"version": INDEX_VERSION, "offsets": {}, "deletions": [], "decisions": 0,
+                               "skipped": 0, "controls": {}}
+    controls = idx["controls"]
+
+    for p in logical_stream_files(evid, "opa_decisions"):
+        key = str(p.relative_to(evid))
+        off = idx["offsets"].get(key, 0)
+        for rec, off in iter_jsonl_from(p, off):
+            reqs = decision_requests(rec)
+            if not reqs:
+                idx["skipped"] += 1
+                continue
+            idx["decisions"] += 1
+            ts = record_ts(rec)
+            for endpoint, release_id in reqs:
+                for cid in controls_for_endpoint(endpoint):
+                    _note(controls.setdefault(cid, empty_entry()), "opa_decisions", ts, release_id)
+        idx["offsets"][key] = off
+
+    seen = set(idx["deletions"])
+    del_dir = evid / "deletions"
+    for p in sorted(del_dir.glob("*.json")) if del_dir.exists() else []:
+        if p.name in seen:
+            continue
+        try:
+            rec = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            rec = {}
+        rec = rec if isinstance(rec, dict) else {}
+        ts = record_ts(rec)
+        _note(controls.setdefault("ID-RET-01", empty_entry()), "deletions",
+              ts if ts is not None else p.stat().st_mtime, rec.get("release_id"))
+        idx["deletions"].append(p.name)
+
+    save_index(evid, idx)
+    return idx
+
+# Newest evidence timestamp across all controls (the index's notion of "now")
+def head_ts(idx: dict):
+    ts = [e["last_ts"] for e in idx["controls"].values() if e["last_ts"] is not None]
+    return max(ts) if ts else None
@@ -0,0 +1,158 @@
+import heapq, json, re
+from datetime import datetime
+from pathlib import Path
+
+# Reader side of the collector's evidence layout:
+#   evidence/<stream>.jsonl                                   single-file layout
+#   evidence/segments/<stream>/<stream>-<seq>-<opened>.jsonl  segmented layout
+#   evidence/segments/<stream>/<segment>.manifest.json        sidecar of a closed segment
+# A multi-worker collector writes one shard per worker, <stream>.<worker>, in either layout;
+# the logical stream is the unsharded files plus every shard.
+STREAMS = ("opa_decisions", "events")
+MANIFEST_SUFFIX = ".manifest.json"
+
+def read_manifest(segment: Path):
+    p = segment.with_name(segment.name + MANIFEST_SUFFIX)
+    if not p.exists():
+        return None
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+def list_segments(evid: Path, stream: str) -> list[dict]:
+    sdir = evid / "segments" / stream
+    if not sdir.exists():
+        return []
+    segs = []
+    for p in sorted(sdir.glob(f"{stream}-*.jsonl")):
+        segs.append({"path": p, "manifest": read_manifest(p)})
+    return segs
+
+def overlaps(manifest, t_from=None, t_to=None) -> bool:
+    if manifest is None:
+        return True  # active segment: no sidecar yet
+    lo, hi = manifest.get("ts_min"), manifest.get("ts_max")
+    if lo is None or hi is None:
+        return manifest.get("records", 1) > 0
+    if t_from is not None and hi < t_from:
+        return False
+    if t_to is not None and lo >= t_to:
+        return False
+    return True
+
+# Evidence files for a stream, oldest first: the legacy single file, then segments
+def stream_files(evid: Path, stream: str, t_from=None, t_to=None) -> list[Path]:
+    files = []
+    legacy = evid / f"{stream}.jsonl"
+    if legacy.exists():
+        files.append(legacy)
+    for s in list_segments(evid, stream):
+        if overlaps(s["manifest"], t_from, t_to):
+            files.append(s["path"])
+    return files
+
+def stream_bytes(evid: Path, stream: str) -> int:
+    total = 0
+    for name in [stream] + shard_streams(evid, stream):
+        legacy = evid / f"{name}.jsonl"
+        if legacy.exists():
+            total += legacy.stat().st_size
+        for s in list_segments(evid, name):
+            m = s["manifest"]
+            total += m["bytes"] if m and "bytes" in m else s["path"].stat().st_size
+    return total
+
+def iter_jsonl(path: Path):
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(rec, list):
+                # older collectors stored each OPA upload (a JSON array) as one line
+                yield from (x for x in rec if isinstance(x, dict))
+            else:
+                yield rec
+
+def shard_streams(evid: Path, stream: str) -> list[str]:
+    pat = re.compile(rf"^{re.escape(stream)}\.(\d+)$")
+    names = {p.name[:-len(".jsonl")] for p in evid.glob(f"{stream}.*.jsonl")}
+    sdir = evid / "segments"
+    if sdir.exists():
+        names |= {d.name for d in sdir.glob(f"{stream}.*") if d.is_dir()}
+    return sorted((n for n in names if pat.match(n)), key=lambda n: int(pat.match(n).group(1)))
+
+# Physical streams backing a logical stream: the unsharded one (if present), then shards by worker
+def physical_streams(evid: Path, stream: str) -> list[str]:
+    base = [stream] if (evid / f"{stream}.jsonl").exists() or list_segments(evid, stream) else []
+    return base + shard_streams(evid, stream)
+
+def record_ts(rec: dict):
+    v = rec.get("ts", rec.get("timestamp"))
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return float(v)
+    if isinstance(v, str):
+        # OPA uses RFC3339 with nanoseconds; fromisoformat takes at most microseconds
+        m = re.match(r"^(.*T\d\d:\d\d:\d\d)(\.\d+)?(Z|[+-]\d\d:\d\d)?$", v)
+        if m:
+            tz = m.group(3) or "Z"
+            try:
+                return datetime.fromisoformat(m.group(1) + (m.group(2) or "")[:7] + ("+00:00" if tz == "Z" else tz)).timestamp()
+            except ValueError:
+                return None
+    return None
+
+# (record, offset just past its line) from byte `offset` on; stops before a partially written tail
+def iter_jsonl_from(path: Path, offset: int = 0):
+    with path.open("rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(rec, list):
+                for x in rec:
+                    if isinstance(x, dict):
+                        yield x, offset
+            else:
+                yield rec, offset
+
+# All files of a logical stream (every shard), each oldest first
+def logical_stream_files(evid: Path, stream: str, t_from=None, t_to=None) -> list[Path]:
+    return [p for s in physical_streams(evid, stream) for p in stream_files(evid, s, t_from, t_to)]
+
+# (key, shard, seq, record) where key is the running max timestamp, so each shard's keys
+# never decrease and records keep their append (seq) order within the shard
+def _keyed(records, shard: int):
+    key = float("-inf")
+    for seq, rec in enumerate(records):
+        ts = record_ts(rec)
+        if ts is not None and ts > key:
+            key = ts
+        yield key, shard, seq, rec
+
+def _iter_physical(evid: Path, stream: str, t_from=None, t_to=None):
+    for p in stream_files(evid, stream, t_from, t_to):
+        yield from iter_jsonl(p)
+
+# Records of a logical stream; closed segments whose manifest time range misses [t_from, t_to)
+# are skipped. Shards are merged on read into one time-ordered stream.
+def iter_records(evid: Path, stream: str, t_from=None, t_to=None):
+    streams = physical_streams(evid, stream)
+    if len(streams) == 1:
+        yield from _iter_physical(evid, streams[0], t_from, t_to)
+        return
+    parts = [_keyed(_iter_physical(evid, s, t_from, t_to), i) for i, s in enumerate(streams)]
+    for _, _, _, rec in heapq.merge(*parts, key=lambda x: x[:3]):
+        yield rec
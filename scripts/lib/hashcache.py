@@ -0,0 +1,149 @@
+import ctypes, ctypes.util, hashlib, os, sqlite3, threading
+from pathlib import Path
+
+# Persistent sha256 cache shared by all scripts. Entries are keyed on the resolved path and
+# validated against (size, mtime_ns, inode); an unchanged file is never reread. For files the
+# caller marks append_only (evidence logs), the saved SHA-256 context at the cached size lets
+# the digest resume over just the appended bytes, after a spot check that the last block
+# before the old end is unchanged. append_only is the caller's promise that earlier bytes are
+# never rewritten; a change that does not grow the file is always rehashed. The cache is one
+# SQLite database (WAL, busy timeout), so concurrent scripts can read and update it safely;
+# HASH_CACHE overrides its location.
+#
+# Trust model: a cached answer is only as good as the stat data and the tail check. A file
+# rewritten in place with its mtime restored, or one whose earlier bytes changed while it
+# grew, gets the cached (or resumed) digest, not its real one. That is fine for citing our own
+# evidence in routine exports, not for checking it. Anything that verifies evidence passes
+# refresh=True, which ignores the cached entry, rereads the whole file and stores the fresh
+# result; HASH_CACHE_REFRESH=1 forces that for every caller (audit runs).
+ROOT = Path(__file__).resolve().parents[2]
+CACHE_PATH = Path(os.getenv("HASH_CACHE", str(ROOT / "out" / ".cache" / "hashes.sqlite")))
+FORCE_REFRESH = os.getenv("HASH_CACHE_REFRESH", "0") == "1"
+CHUNK = 1024 * 1024
+TAIL_CHECK = 4096
+
+# Resumable digests need the raw SHA256_CTX from OpenSSL's libcrypto (the one hashlib uses):
+# {uint32 h[8], Nl, Nh, data[16], num, md_len}. Without it, appended files are rehashed fully.
+class _SHA256_CTX(ctypes.Structure):
+    _fields_ = [("h", ctypes.c_uint32 * 8), ("Nl", ctypes.c_uint32), ("Nh", ctypes.c_uint32),
+                ("data", ctypes.c_uint32 * 16), ("num", ctypes.c_uint32), ("md_len", ctypes.c_uint32)]
+
+def _load_libcrypto():
+    candidates = [ctypes.util.find_library("crypto")]
+    try:
+        import _hashlib
+        candidates.append(_hashlib.__file__)
+    except ImportError:
+        pass
+    for name in candidates:
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name)
+            for fn in ("SHA256_Init", "SHA256_Update", "SHA256_Final"):
+                getattr(lib, fn).restype = ctypes.c_int
+            lib.SHA256_Update.argtypes = [ctypes.POINTER(_SHA256_CTX), ctypes.c_char_p, ctypes.c_size_t]
+            return lib
+        except (OSError, AttributeError):
+            continue
+    return None
+
+_crypto = _load_libcrypto()
+
+class _ResumableSHA256:
+    def __init__(self, state: bytes | None = None):
+        self.ctx = _SHA256_CTX()
+        if state is None:
+            _crypto.SHA256_Init(ctypes.byref(self.ctx))
+        else:
+            ctypes.memmove(ctypes.byref(self.ctx), state, ctypes.sizeof(self.ctx))
+
+    def update(self, data: bytes):
+        _crypto.SHA256_Update(ctypes.byref(self.ctx), data, len(data))
+
+    def state(self) -> bytes:
+        return ctypes.string_at(ctypes.byref(self.ctx), ctypes.sizeof(self.ctx))
+
+    def hexdigest(self) -> str:
+        ctx = _SHA256_CTX.from_buffer_copy(self.state())
+        out = ctypes.create_string_buffer(32)
+        _crypto.SHA256_Final(out, ctypes.byref(ctx))
+        return out.raw.hex()
+
+def _self_test() -> bool:
+    h = _ResumableSHA256()
+    h.update(b"abc")
+    h = _ResumableSHA256(h.state())
+    h.update(b"def")
+    return h.hexdigest() == hashlib.sha256(b"abcdef").hexdigest()
+
+if _crypto is not None:
+    try:
+        if not _self_test():
+            _crypto = None
+    except Exception:
+        _crypto = None
+
+_local = threading.local()
+
+def _db() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,"
+                     " inode INTEGER, sha256 TEXT, state BLOB, tail TEXT)")
+        _local.conn = conn
+    return conn
+
+def _tail_digest(f, end: int) -> str:
+    f.seek(max(0, end - TAIL_CHECK))
+    return hashlib.sha256(f.read(end - max(0, end - TAIL_CHECK))).hexdigest()
+
+# Plain chunked sha256 of a file, bypassing the cache (for files hashed once, e.g. new bundles)
+def sha256_path(p: Path) -> str:
+    h = hashlib.sha256()
+    with Path(p).open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# The cached digest when the entry still matches the file's stat data, without hashing anything
+def cached_sha256(p: Path):
+    p = Path(p)
+    st = p.stat()
+    row = _db().execute("SELECT size, mtime_ns, inode, sha256 FROM hashes WHERE path = ?", (str(p.resolve()),)).fetchone()
+    return row[3] if row and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino) else None
+
+def sha256_file(p: Path, append_only: bool = False, refresh: bool = False) -> str:
+    p = Path(p)
+    refresh = refresh or FORCE_REFRESH
+    key = str(p.resolve())
+    st = p.stat()
+    db = _db()
+    row = db.execute("SELECT size, mtime_ns, inode, sha256, state, tail FROM hashes WHERE path = ?", (key,)).fetchone()
+    if row and not refresh and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+        return row[3]
+
+    with p.open("rb") as f:
+        h, pos = None, 0
+        if (append_only and row and not refresh and _crypto is not None and row[4] and row[2] == st.st_ino
+                and row[0] < st.st_size and _tail_digest(f, row[0]) == row[5]):
+            h, pos = _ResumableSHA256(row[4]), row[0]
+        if h is None:
+            h = _ResumableSHA256() if _crypto is not None else hashlib.sha256()
+        # hash exactly the size that was stat'ed, even if the file keeps growing
+        f.seek(pos)
+        while pos < st.st_size:
+            chunk = f.read(min(CHUNK, st.st_size - pos))
+            if not chunk:
+                break
+            h.update(chunk)
+            pos += len(chunk)
+        digest = h.hexdigest()
+        state = h.state() if isinstance(h, _ResumableSHA256) else None
+        tail = _tail_digest(f, pos)
+    db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+               (key, pos, st.st_mtime_ns, st.st_ino, digest, state, tail))
+    return digest
@@ -0,0 +1,168 @@
+import json, os, struct
+from bisect import bisect_left
+from pathlib import Path
+
+from scripts.lib.sketch import merge_all
+
+# Multi-resolution store for monitoring windows (window_summarizer schema). Each level keeps
+#   level_<sec>.jsonl  one window per line, append-only (a rewritten window is appended again)
+#   level_<sec>.idx    fixed-size (window_start, offset, length) records sorted by window_start
+# The finest level is written by the summarizer; every coarser level is rebuilt only for the
+# parents of changed windows, by merging that parent's children from the level below.
+CONTROLS = ["ID-LOG-01","ID-PUR-01","ID-MIN-01","ID-RET-01","ID-ACC-01"]
+CORE_CONTROLS = ["ID-LOG-01","ID-PUR-01","ID-ACC-01"]
+COARSER_LEVELS = (60, 600, 3600, 86400)
+IDX = struct.Struct("<qqI")
+
+def default_levels(finest: int) -> list[int]:
+    return [finest] + [s for s in COARSER_LEVELS if s > finest and s % finest == 0]
+
+def merge_windows(children: list[dict], start: int, end: int) -> dict:
+    w = {
+        "window_start": start,
+        "window_end": end,
+        "controls_seen": {cid: 0 for cid in CONTROLS},
+        "allow_count": 0,
+        "deny_count": 0,
+        "lat_ms_p50": None,
+        "lat_ms_p95": None,
+        "lat_ms_p99": None,
+        "lat_sketch": None,
+        "log_schema_ok": 0,
+        "log_schema_bad": 0,
+        "deletion_events": 0
+    }
+    for c in children:
+        for cid in CONTROLS:
+            w["controls_seen"][cid] += c["controls_seen"].get(cid, 0)
+        for k in ("allow_count", "deny_count", "log_schema_ok", "log_schema_bad", "deletion_events"):
+            w[k] += c.get(k, 0)
+    sketches = [c["lat_sketch"] for c in children if c.get("lat_sketch")]
+    if sketches:
+        sk = merge_all(sketches)
+        w["lat_ms_p50"], w["lat_ms_p95"], w["lat_ms_p99"] = sk.quantile(0.5), sk.quantile(0.95), sk.quantile(0.99)
+        w["lat_sketch"] = sk.to_dict()
+    w["missing_core_controls"] = [cid for cid, c in w["controls_seen"].items() if c == 0 and cid in CORE_CONTROLS]
+    return w
+
+class Level:
+    def __init__(self, directory: Path, sec: int):
+        self.sec = sec
+        self.data = directory / f"level_{sec}.jsonl"
+        self.idx = directory / f"level_{sec}.idx"
+        self.starts: list[int] = []
+        self.entries: list[tuple[int, int]] = []
+        if self.idx.exists():
+            for start, off, n in IDX.iter_unpack(self.idx.read_bytes()):
+                self.starts.append(start)
+                self.entries.append((off, n))
+
+    def live_bytes(self) -> int:
+        return sum(n for _, n in self.entries)
+
+    def put(self, windows: list[dict]):
+        if not windows:
+            return
+        with self.data.open("ab") as f:
+            off = f.tell()
+            for w in windows:
+                line = (json.dumps(w) + "\n").encode("utf-8")
+                f.write(line)
+                i = bisect_left(self.starts, w["window_start"])
+                if i < len(self.starts) and self.starts[i] == w["window_start"]:
+                    self.entries[i] = (off, len(line))
+                else:
+                    self.starts.insert(i, w["window_start"])
+                    self.entries.insert(i, (off, len(line)))
+                off += len(line)
+        # rewritten windows leave dead lines behind; compact once they outweigh the live ones
+        if self.data.stat().st_size > 2 * self.live_bytes():
+            self.compact()
+        self.save_index()
+
+    def get_range(self, t_from=None, t_to=None) -> list[dict]:
+        lo = 0 if t_from is None else bisect_left(self.starts, t_from - self.sec + 1)
+        hi = len(self.starts) if t_to is None else bisect_left(self.starts, t_to)
+        out = []
+        if lo >= hi:
+            return out
+        with self.data.open("rb") as f:
+            for off, n in self.entries[lo:hi]:
+                f.seek(off)
+                out.append(json.loads(f.read(n)))
+        return out
+
+    def compact(self):
+        tmp = self.data.with_suffix(".jsonl.tmp")
+        entries = []
+        with self.data.open("rb") as src, tmp.open("wb") as dst:
+            for off, n in self.entries:
+                src.seek(off)
+                entries.append((dst.tell(), n))
+                dst.write(src.read(n))
+        os.replace(tmp, self.data)
+        self.entries = entries
+
+    def save_index(self):
+        tmp = self.idx.with_suffix(".idx.tmp")
+        tmp.write_bytes(b"".join(IDX.pack(s, off, n) for s, (off, n) in zip(self.starts, self.entries)))
+        os.replace(tmp, self.idx)
+
+class RollupStore:
+    def __init__(self, directory: Path, levels: list[int]):
+        self.dir = Path(directory)
+        self.levels = sorted(levels)
+        meta = self.dir / "levels.json"
+        if meta.exists() and json.loads(meta.read_text(encoding="utf-8")) != self.levels:
+            # a different finest resolution invalidates every coarser level
+            for p in self.dir.glob("level_*"):
+                p.unlink()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        meta.write_text(json.dumps(self.levels), encoding="utf-8")
+        self._levels = {s: Level(self.dir, s) for s in self.levels}
+
+    # windows: changed windows at the finest level
+    def update(self, windows: list[dict]):
+        self._levels[self.levels[0]].put(windows)
+        changed = {w["window_start"] for w in windows}
+        for finer, sec in zip(self.levels, self.levels[1:]):
+            parents = sorted({s // sec * sec for s in changed})
+            below = self._levels[finer]
+            self._levels[sec].put([merge_windows(below.get_range(p, p + sec), p, p + sec) for p in parents])
+            changed = set(parents)
+
+    # (first window_start, last window_end) at the finest level, or None when empty
+    def extent(self):
+        fine = self._levels[self.levels[0]]
+        if not fine.starts:
+            return None
+        return fine.starts[0], fine.starts[-1] + fine.sec
+
+    def pick_level(self, t_from, t_to, max_points: int) -> int:
+        ext = self.extent()
+        if ext:
+            t_from = ext[0] if t_from is None else max(t_from, ext[0])
+            t_to = ext[1] if t_to is None else min(t_to, ext[1])
+        span = (t_to - t_from) if t_from is not None and t_to is not None else None
+        for sec in self.levels:
+            if span is None or span / sec <= max_points:
+                return sec
+        return self.levels[-1]
+
+    # windows overlapping [t_from, t_to) at `level` seconds, or at the finest level that keeps
+    # the result within max_points windows
+    def query(self, t_from=None, t_to=None, level: int | None = None, max_points: int | None = None) -> list[dict]:
+        if level is None:
+            level = self.pick_level(t_from, t_to, max_points) if max_points else self.levels[0]
+        if level not in self._levels:
+            raise ValueError(f"no rollup level {level}s (have {self.levels})")
+        return self._levels[level].get_range(t_from, t_to)
+
+def open_store(evid: Path, finest: int | None = None):
+    d = evid / "monitoring" / "rollups"
+    meta = d / "levels.json"
+    if finest is None:
+        if not meta.exists():
+            return None
+        return RollupStore(d, json.loads(meta.read_text(encoding="utf-8")))
+    return RollupStore(d, default_levels(finest))
@@ -1,9 +1,14 @@
-import asyncio, time, os, json
+import argparse, asyncio, time, os, json, sys
+from concurrent.futures import ProcessPoolExecutor
 import httpx
 from pathlib import Path
 import numpy as np
 import pandas as pd
 
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from scripts.lib.sketch import QuantileSketch, merge_all
+
 API = os.getenv("API_URL","http://localhost:8080")
 N = int(os.getenv("N","5000"))
 CONC = int(os.getenv("CONC","50"))
@@ -11,11 +16,42 @@ SEED = int(os.getenv("SEED","1337"))
 WORKLOAD = os.getenv("WORKLOAD","wallet")  # wallet or onboarding
 USE_MIDV500 = os.getenv("USE_MIDV500","0") == "1"
 
-ROOT = Path(__file__).resolve().parents[1]
+# LOAD_MODE=closed: CONC workers, each sends its next request when the previous one returns.
+# LOAD_MODE=open: requests are released on an arrival schedule regardless of completions, and
+#   latency is measured from each request's intended send time, so queueing delay is not
+#   hidden (no coordinated omission). ARRIVAL = constant | poisson at RPS, or step through
+#   RPS_STEPS (comma list) for STEP_SEC each; MAX_INFLIGHT caps open connections (requests
+#   beyond it wait, and the wait counts toward their latency).
+# LOAD_MODE=ramp: open-loop stages of RAMP_STEP_N requests from RAMP_START_RPS, multiplied by
+#   RAMP_FACTOR up to RAMP_MAX_RPS, stopping at the first stage that misses the SLO (p99 above
+#   SLO_P99_MS, achieved rate below RAMP_MIN_ACHIEVED of target, or ok_rate below RAMP_MIN_OK).
+LOAD_MODE = os.getenv("LOAD_MODE", "closed")
+RPS = float(os.getenv("RPS", "200"))
+ARRIVAL = os.getenv("ARRIVAL", "constant")
+RPS_STEPS = [float(x) for x in os.getenv("RPS_STEPS", "").split(",") if x.strip()]
+STEP_SEC = float(os.getenv("STEP_SEC", "10"))
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "1000"))
+SLO_P99_MS = float(os.getenv("SLO_P99_MS", "100"))
+RAMP_START_RPS = float(os.getenv("RAMP_START_RPS", "50"))
+RAMP_FACTOR = float(os.getenv("RAMP_FACTOR", "1.5"))
+RAMP_MAX_RPS = float(os.getenv("RAMP_MAX_RPS", "20000"))
+RAMP_STEP_N = int(os.getenv("RAMP_STEP_N", str(N)))
+RAMP_MIN_ACHIEVED = float(os.getenv("RAMP_MIN_ACHIEVED", "0.95"))
+RAMP_MIN_OK = float(os.getenv("RAMP_MIN_OK", "0.99"))
+# --procs / LOADGEN_PROCS > 1: the N requests (and CONC, or the arrival rate) are split across
+# worker processes (closed loop: at most CONC of them), each with payload and arrival seeds
+# spawned from SEED, so a given (SEED, procs) always sends the same requests. Workers return
+# their rows and a latency sketch; the parent merges them into the usual CSV and summary.
+# All shards start together SHARD_START_DELAY seconds after launch.
+PROCS = int(os.getenv("LOADGEN_PROCS", "1"))
+SHARD_START_DELAY = float(os.getenv("SHARD_START_DELAY", "1.0"))
+
 OUT = ROOT / "out" / "metrics"
 OUT.mkdir(parents=True, exist_ok=True)
 
 rng = np.random.default_rng(SEED)
+# arrival schedules draw from their own stream so payloads do not depend on the load mode
+arrival_rng = np.random.default_rng([SEED, 1])
 
 MIDV_INDEX = ROOT / "data" / "midv500_index.jsonl"
 MIDV_ROOT = ROOT / "data" / "midv500"
@@ -87,9 +123,9 @@ def make_onboarding_payload(doc=None):
         "doc_sha256": doc["doc_sha256"],
     }, "/onboarding/process"
 
-def build_queue_items():
+def build_queue_items(n=N):
     if WORKLOAD == "wallet":
-        return [make_wallet_payload() for _ in range(N)]
+        return [make_wallet_payload() for _ in range(n)]
     else:
         if USE_MIDV500:
             docs = read_jsonl(MIDV_INDEX)
@@ -97,8 +133,36 @@ def build_queue_items():
                 docs = [{"doc_source":"MIDV-500","doc_path":str(p.relative_to(MIDV_ROOT)), "doc_bytes":p.stat().st_size, "doc_sha256":"(run midv500_ingest for sha256)"} 
                         for p in sorted(MIDV_ROOT.rglob("*")) if p.is_file()]
             if docs:
-                return [make_onboarding_payload(docs[i % len(docs)]) for i in range(N)]
-        return [make_onboarding_payload(None) for _ in range(N)]
+                return [make_onboarding_payload(docs[i % len(docs)]) for i in range(n)]
+        return [make_onboarding_payload(None) for _ in range(n)]
+
+# Intended send offsets (seconds from start) for n requests
+def arrival_offsets(n: int, rps: float, arrival: str = ARRIVAL, steps=RPS_STEPS) -> np.ndarray:
+    if arrival == "constant":
+        return np.arange(n, dtype=np.float64) / rps
+    if arrival == "poisson":
+        return np.concatenate([[0.0], np.cumsum(arrival_rng.exponential(1.0 / rps, n - 1))]) if n else np.zeros(0)
+    if arrival == "step":
+        if not steps:
+            raise SystemExit("ARRIVAL=step needs RPS_STEPS, e.g. RPS_STEPS=100,200,400")
+        out, t = [], 0.0
+        for i, r in enumerate(steps):
+            # the last step continues until all n requests are sent
+            end = t + STEP_SEC if i < len(steps) - 1 else float("inf")
+            k = 0
+            while len(out) < n and t + k / r < end:
+                out.append(t + k / r)
+                k += 1
+            t = end
+        return np.asarray(out, dtype=np.float64)
+    raise SystemExit(f"unknown ARRIVAL {arrival!r} (constant, poisson or step)")
+
+async def post(client: httpx.AsyncClient, payload: dict, path: str):
+    try:
+        resp = await client.post(API + path, json=payload, timeout=15.0)
+        return resp.status_code, resp.json().get("allow", None)
+    except Exception:
+        return 0, None
 
 async def worker(client: httpx.AsyncClient, q: asyncio.Queue, results: list):
     while True:
@@ -108,47 +172,201 @@ async def worker(client: httpx.AsyncClient, q: asyncio.Queue, results: list):
             return
         payload, path = item
         t0 = time.perf_counter()
-        try:
-            resp = await client.post(API + path, json=payload, timeout=15.0)
-            status = resp.status_code
-            data = resp.json()
-            allow = data.get("allow", None)
-        except Exception:
-            status = 0
-            allow = None
+        status, allow = await post(client, payload, path)
         t1 = time.perf_counter()
         results.append(((t1-t0)*1000.0, status, allow))
         q.task_done()
 
-async def main():
+# start_at (epoch seconds) holds the workers back until every process is ready
+async def run_closed(items, conc: int = CONC, start_at: float | None = None) -> pd.DataFrame:
     q = asyncio.Queue()
     results = []
-    items = build_queue_items()
     async with httpx.AsyncClient() as client:
-        workers = [asyncio.create_task(worker(client, q, results)) for _ in range(CONC)]
+        if start_at is not None:
+            await asyncio.sleep(max(0.0, start_at - time.time()))
+        workers = [asyncio.create_task(worker(client, q, results)) for _ in range(conc)]
         for it in items:
             q.put_nowait(it)
-        for _ in range(CONC):
+        for _ in range(conc):
             q.put_nowait(None)
         await q.join()
         for w in workers:
             await w
+    return pd.DataFrame(results, columns=["lat_ms","status","allow"])
+
+# Open loop: item i is due at start + offsets[i]. lat_ms runs from that intended time to the
+# response; send_lag_ms is how late it actually went out and service_ms the request itself.
+# start_at (epoch seconds) lines up the schedules of several processes.
+async def run_open(items, offsets, start_at: float | None = None) -> pd.DataFrame:
+    results = []
+    sem = asyncio.Semaphore(MAX_INFLIGHT)
+    limits = httpx.Limits(max_connections=MAX_INFLIGHT, max_keepalive_connections=MAX_INFLIGHT)
+
+    async def one(client, payload, path, due):
+        async with sem:
+            sent = time.perf_counter()
+            status, allow = await post(client, payload, path)
+        done = time.perf_counter()
+        results.append(((done - due) * 1000.0, status, allow, (due - start) * 1000.0,
+                        (sent - due) * 1000.0, (done - sent) * 1000.0, done - start))
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        tasks = []
+        start = time.perf_counter() + (max(0.0, start_at - time.time()) if start_at is not None else 0.0)
+        for (payload, path), off in zip(items, offsets):
+            due = start + float(off)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(client, payload, path, due)))
+        await asyncio.gather(*tasks)
+
+    df = pd.DataFrame(results, columns=["lat_ms","status","allow","intended_ms","send_lag_ms","service_ms","done_s"])
+    return df.sort_values("intended_ms", kind="stable").reset_index(drop=True)
 
-    df = pd.DataFrame(results, columns=["lat_ms","status","allow"])
-    out_path = OUT / f"load_{WORKLOAD}_N{N}_C{CONC}_midv{int(USE_MIDV500)}.csv"
-    df.to_csv(out_path, index=False)
-    summ = {
-        "workload": WORKLOAD,
-        "use_midv500": USE_MIDV500,
-        "N": N, "CONC": CONC,
-        "p50_ms": float(df["lat_ms"].quantile(0.5)),
-        "p95_ms": float(df["lat_ms"].quantile(0.95)),
-        "p99_ms": float(df["lat_ms"].quantile(0.99)),
+# Rates of an open-loop run (rows from one or several processes sharing a start time)
+def open_rates(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    span = float(df["intended_ms"].max() - df["intended_ms"].min()) / 1000.0 if len(df) > 1 else 0.0
+    elapsed = float(df["done_s"].max()) if len(df) else 0.0
+    rate = {
+        "target_rps": (len(df) - 1) / span if span > 0 else None,
+        "achieved_rps": len(df) / elapsed if elapsed > 0 else None,
+        "send_lag_p99_ms": float(df["send_lag_ms"].quantile(0.99)) if len(df) else None,
+        "service_p99_ms": float(df["service_ms"].quantile(0.99)) if len(df) else None,
+        "duration_s": elapsed,
+    }
+    return df.drop(columns=["done_s"]), rate
+
+# Percentiles are exact for a single process and come from the merged sketch (within 1%)
+# when shards were measured by several processes
+def latency_summary(df: pd.DataFrame, sk: QuantileSketch | None = None) -> dict:
+    exact = sk is None
+    if exact:
+        sk = QuantileSketch()
+        sk.add_many(df["lat_ms"].to_numpy())
+    q = (lambda p: float(df["lat_ms"].quantile(p))) if exact else sk.quantile
+    return {
+        "p50_ms": q(0.5),
+        "p95_ms": q(0.95),
+        "p99_ms": q(0.99),
         "mean_ms": float(df["lat_ms"].mean()),
-        "ok_rate": float((df["status"]==200).mean())
+        "ok_rate": float((df["status"]==200).mean()),
+        # mergeable across runs/processes (scripts/lib/sketch.py)
+        "lat_sketch": sk.to_dict()
     }
-    (OUT / f"summary_{WORKLOAD}_N{N}_C{CONC}_midv{int(USE_MIDV500)}.json").write_text(json.dumps(summ, indent=2), encoding="utf-8")
-    print(json.dumps(summ, indent=2))
+
+def split(total: int, parts: int) -> list[int]:
+    return [total // parts + (1 if k < total % parts else 0) for k in range(parts)]
+
+# (payload seed, arrival seed) of shard k; ramp stages get their own streams
+def shard_seeds(k: int, procs: int, stage: int = 0):
+    root = np.random.SeedSequence(SEED if stage == 0 else [SEED, stage])
+    return root.spawn(procs)[k].spawn(2)
+
+def run_shard(task: dict):
+    global rng, arrival_rng
+    k, procs = task["shard"], task["procs"]
+    payload_seed, arrival_seed = shard_seeds(k, procs, task["stage"])
+    rng, arrival_rng = np.random.default_rng(payload_seed), np.random.default_rng(arrival_seed)
+    items = build_queue_items(task["n"])
+    if task["mode"] == "closed":
+        df = asyncio.run(run_closed(items, task["conc"], task["start_at"]))
+    else:
+        rps, arrival = task["rps"], task["arrival"]
+        offsets = arrival_offsets(task["n"], rps / procs, arrival, [r / procs for r in RPS_STEPS])
+        if arrival == "constant":
+            offsets = offsets + k / rps  # interleave the shards into one evenly spaced stream
+        df = asyncio.run(run_open(items, offsets, task["start_at"]))
+    sk = QuantileSketch()
+    sk.add_many(df["lat_ms"].to_numpy())
+    df.insert(0, "shard", k)
+    return df, sk.to_dict()
+
+# One measurement: (rows, rates or None for closed loop, latency summary)
+async def measure(mode: str, n: int, rps: float | None = None, arrival: str = ARRIVAL, stage: int = 0):
+    if PROCS <= 1:
+        items = build_queue_items(n)
+        if mode == "closed":
+            df = await run_closed(items)
+            return df, None, latency_summary(df)
+        df, rate = open_rates(await run_open(items, arrival_offsets(n, rps, arrival)))
+        return df, rate, latency_summary(df)
+    start_at = time.time() + SHARD_START_DELAY
+    tasks = [{"shard": k, "procs": PROCS, "n": nk, "conc": ck, "mode": mode, "rps": rps,
+              "arrival": arrival, "start_at": start_at, "stage": stage}
+             for k, (nk, ck) in enumerate(zip(split(n, PROCS), split(CONC, PROCS))) if nk]
+    with ProcessPoolExecutor(len(tasks)) as ex:
+        parts = await asyncio.get_running_loop().run_in_executor(None, lambda: list(ex.map(run_shard, tasks)))
+    df = pd.concat([d for d, _ in parts], ignore_index=True)
+    sk = merge_all([s for _, s in parts])
+    rate = None
+    if mode != "closed":
+        df = df.sort_values("intended_ms", kind="stable").reset_index(drop=True)
+        df, rate = open_rates(df)
+    return df, rate, latency_summary(df, sk)
+
+def write_summary(name: str, summ: dict):
+    (OUT / f"summary_{name}.json").write_text(json.dumps(summ, indent=2), encoding="utf-8")
+    print(json.dumps({k: v for k, v in summ.items() if k != "lat_sketch"}, indent=2))
+
+def open_label(rps: float) -> str:
+    if ARRIVAL == "step":
+        return "open_step" + "-".join(f"{r:g}" for r in RPS_STEPS)
+    return f"open_{ARRIVAL}{rps:g}"
+
+async def main_ramp():
+    stages = []
+    rps = RAMP_START_RPS
+    best = None
+    while rps <= RAMP_MAX_RPS:
+        _, rate, lat = await measure("open", RAMP_STEP_N, rps, "poisson" if ARRIVAL == "poisson" else "constant", stage=len(stages))
+        st = {**rate, "target_rps": rps, **lat}
+        st.pop("lat_sketch")
+        st["sustained"] = (st["p99_ms"] <= SLO_P99_MS and st["ok_rate"] >= RAMP_MIN_OK
+                           and (st["achieved_rps"] or 0) >= RAMP_MIN_ACHIEVED * rps)
+        stages.append(st)
+        print(f"ramp {rps:g} rps: achieved={st['achieved_rps']:.1f} p99={st['p99_ms']:.2f}ms ok={st['ok_rate']:.3f} sustained={st['sustained']}")
+        if not st["sustained"]:
+            break
+        best = st
+        rps *= RAMP_FACTOR
+    name = f"{WORKLOAD}_ramp_slo{SLO_P99_MS:g}_midv{int(USE_MIDV500)}"
+    pd.DataFrame(stages).to_csv(OUT / f"load_{name}.csv", index=False)
+    write_summary(name, {
+        "workload": WORKLOAD, "use_midv500": USE_MIDV500, "mode": "ramp", "arrival": ARRIVAL,
+        "slo_p99_ms": SLO_P99_MS, "step_n": RAMP_STEP_N, **({"procs": PROCS} if PROCS > 1 else {}),
+        "max_sustainable_rps": best["target_rps"] if best else None,
+        "max_sustainable_achieved_rps": best["achieved_rps"] if best else None,
+        "p99_ms_at_max": best["p99_ms"] if best else None,
+        "stages": len(stages),
+    })
+
+async def main():
+    if LOAD_MODE == "ramp":
+        await main_ramp()
+        return
+    if LOAD_MODE == "open":
+        df, rate, lat = await measure("open", N, RPS)
+        name = f"{WORKLOAD}_N{N}_{open_label(RPS)}_midv{int(USE_MIDV500)}"
+        head = {"workload": WORKLOAD, "use_midv500": USE_MIDV500, "N": N, "mode": "open", "arrival": ARRIVAL,
+                "rps": RPS if ARRIVAL != "step" else RPS_STEPS, "max_inflight": MAX_INFLIGHT, **rate}
+    elif LOAD_MODE == "closed":
+        df, _, lat = await measure("closed", N)
+        name = f"{WORKLOAD}_N{N}_C{CONC}_midv{int(USE_MIDV500)}"
+        head = {"workload": WORKLOAD, "use_midv500": USE_MIDV500, "N": N, "CONC": CONC}
+    else:
+        raise SystemExit(f"unknown LOAD_MODE {LOAD_MODE!r} (closed, open or ramp)")
+    if PROCS > 1:
+        head["procs"] = PROCS
+    df.to_csv(OUT / f"load_{name}.csv", index=False)
+    write_summary(name, {**head, **lat})
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--procs", type=int, default=PROCS, help="worker processes to shard the requests across")
+    PROCS = ap.parse_args().procs
+    if LOAD_MODE == "closed" and PROCS > CONC:
+        # every process needs at least one worker; more processes would exceed CONC
+        print(f"--procs {PROCS} > CONC={CONC}; using {CONC} processes")
+        PROCS = CONC
     asyncio.run(main())
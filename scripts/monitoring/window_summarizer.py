@@ -1,7 +1,11 @@
-import json, time, math, os
+import json, time, math, os, shutil, sys
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from scripts.lib.evidence import iter_jsonl_from, iter_records, logical_stream_files
+from scripts.lib.rollups import open_store
+from scripts.lib.sketch import QuantileSketch, merge_all
 OUT = ROOT / "out"
 EVID = OUT / "evidence"
 OPA_LOG = EVID / "opa_decisions.jsonl"
@@ -9,23 +13,27 @@ EVENTS = EVID / "events.jsonl"
 DEL_DIR = EVID / "deletions"
 
 WINDOW_SEC = int(os.getenv("WINDOW_SEC", "60"))
+# Optional epoch range; closed evidence segments outside it are skipped via their manifests
+WINDOW_FROM = float(os.environ["WINDOW_FROM"]) if os.getenv("WINDOW_FROM") else None
+WINDOW_TO = float(os.environ["WINDOW_TO"]) if os.getenv("WINDOW_TO") else None
+# WINDOW_INCREMENTAL=1: resume from the checkpoint, read only evidence appended since the last
+# run and rewrite only the windows that changed (plus rollup.json)
+INCREMENTAL = os.getenv("WINDOW_INCREMENTAL", "0") == "1"
+# Windows ending more than this far behind the newest event are closed: the checkpoint drops
+# their aggregates once written, and a late event reloads the window from the rollup store
+LATENESS_SEC = float(os.getenv("WINDOW_LATENESS_SEC", "300"))
+CHECKPOINT_DIR = EVID / "monitoring" / "checkpoint"
+# WINDOW_ENGINE=numpy: load events into typed columns and aggregate with NumPy group-bys
+# (same output as the default per-event loop)
+ENGINE = os.getenv("WINDOW_ENGINE", "python")
+COLUMN_CHUNK = int(os.getenv("WINDOW_COLUMN_CHUNK", "1000000"))
+# Windows also go into the multi-resolution rollup store (evidence/monitoring/rollups);
+# WINDOW_FILES=0 skips the one-JSON-file-per-window output
+WINDOW_FILES = os.getenv("WINDOW_FILES", "1") == "1"
+CONTROLS = ["ID-LOG-01","ID-PUR-01","ID-MIN-01","ID-RET-01","ID-ACC-01"]
+CORE_CONTROLS = ["ID-LOG-01","ID-PUR-01","ID-ACC-01"]
 REQUIRED_LOG_FIELDS = {"control_id","policy_bundle_digest","release_id","environment_id","decision_id","timestamp"}
 
-def read_jsonl(path: Path):
-    if not path.exists():
-        return []
-    out=[]
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line=line.strip()
-            if not line:
-                continue
-            try:
-                out.append(json.loads(line))
-            except Exception:
-                pass
-    return out
-
 def extract_ts_event(e: dict):
     t = e.get("ts")
     if isinstance(t, (int,float)):
@@ -40,41 +48,106 @@ def controls_for_endpoint(endpoint: str):
         base.add("ID-RET-01")
     return base
 
+def event_endpoint(e: dict):
+    et = e.get("type","")
+    return "wallet/verify" if "wallet" in et else "onboarding/process" if "onboarding" in et else None
+
+def decision_schema_counts(e: dict):
+    ok = bad = 0
+    inp = e.get("input")
+    if isinstance(inp, dict):
+        # batch decisions (compliance.authz.batch_allow) carry one request per item
+        reqs = inp.get("requests") if isinstance(inp.get("requests"), list) else [inp.get("request", {})]
+        for req in reqs:
+            fields = set((req or {}).get("log_fields", []) or [])
+            if REQUIRED_LOG_FIELDS.issubset(fields):
+                ok += 1
+            else:
+                bad += 1
+    return ok, bad
+
+def empty_window(wstart: int) -> dict:
+    return {
+        "window_start": wstart,
+        "window_end": wstart + WINDOW_SEC,
+        "controls_seen": {cid: 0 for cid in CONTROLS},
+        "allow_count": 0,
+        "deny_count": 0,
+        "lat_ms_p50": None,
+        "lat_ms_p95": None,
+        "lat_ms_p99": None,
+        "lat_sketch": None,
+        "log_schema_ok": 0,
+        "log_schema_bad": 0,
+        "deletion_events": 0
+    }
+
+def window_range(tmin: float, tmax: float):
+    start = math.floor(tmin / WINDOW_SEC) * WINDOW_SEC
+    end = math.ceil((tmax + 1) / WINDOW_SEC) * WINDOW_SEC
+    if end == start:
+        end = start + WINDOW_SEC
+    return int(start), int(end)
+
+def deletion_counts(windows) -> dict:
+    counts = {}
+    if DEL_DIR.exists():
+        for p in DEL_DIR.glob("*.json"):
+            m = p.stat().st_mtime
+            wstart = int(math.floor(m / WINDOW_SEC) * WINDOW_SEC)
+            if wstart in windows:
+                counts[wstart] = counts.get(wstart, 0) + 1
+    return counts
+
+# Latency percentiles come from a mergeable sketch (relative error <= its alpha); the sketch
+# itself is kept in the window so windows can be merged into coarser ranges later
+def set_latency(w: dict, sk: QuantileSketch):
+    if sk.count:
+        w["lat_ms_p50"], w["lat_ms_p95"], w["lat_ms_p99"] = sk.quantile(0.5), sk.quantile(0.95), sk.quantile(0.99)
+        w["lat_sketch"] = sk.to_dict()
+
+def write_rollup(windows_dir: Path, windows: list[dict], total: QuantileSketch):
+    rollup = {"window_sec": WINDOW_SEC, "windows": windows}
+    rollup["lat_ms_p50"], rollup["lat_ms_p95"], rollup["lat_ms_p99"] = total.quantile(0.5), total.quantile(0.95), total.quantile(0.99)
+    rollup["lat_sketch"] = total.to_dict()
+    (windows_dir.parent / "rollup.json").write_text(json.dumps(rollup, indent=2), encoding="utf-8")
+
+# windows: {window_start: window} to write as files and into the rollup store
+def write_window_files(windows_dir: Path, windows: dict) -> list[dict]:
+    written = []
+    for wstart in sorted(windows):
+        w = windows[wstart]
+        w["missing_core_controls"] = [cid for cid, c in w["controls_seen"].items() if c == 0 and cid in CORE_CONTROLS]
+        if WINDOW_FILES:
+            (windows_dir / f"window_{wstart}.json").write_text(json.dumps(w, indent=2), encoding="utf-8")
+        written.append(w)
+    open_store(EVID, WINDOW_SEC).update(written)
+    return written
+
+def write_windows(windows_dir: Path, windows: dict) -> int:
+    written = write_window_files(windows_dir, windows)
+    write_rollup(windows_dir, written, merge_all(w["lat_sketch"] for w in written if w["lat_sketch"]))
+    return len(written)
+
 def main():
     windows_dir = EVID / "monitoring" / "windows"
     windows_dir.mkdir(parents=True, exist_ok=True)
 
-    opa = read_jsonl(OPA_LOG)
-    evs = read_jsonl(EVENTS)
+    opa = list(iter_records(EVID, "opa_decisions", WINDOW_FROM, WINDOW_TO))
+    evs = list(iter_records(EVID, "events", WINDOW_FROM, WINDOW_TO))
+    if WINDOW_FROM is not None or WINDOW_TO is not None:
+        evs = [e for e in evs if (WINDOW_FROM is None or extract_ts_event(e) >= WINDOW_FROM)
+               and (WINDOW_TO is None or extract_ts_event(e) < WINDOW_TO)]
 
     if not opa and not evs:
         (windows_dir / "window_empty.json").write_text(json.dumps({"window_sec": WINDOW_SEC, "note":"no evidence"}, indent=2), encoding="utf-8")
         return
 
     ts_list=[extract_ts_event(e) for e in evs] if evs else [time.time()]
-    tmin, tmax = min(ts_list), max(ts_list)
-
-    start = math.floor(tmin / WINDOW_SEC) * WINDOW_SEC
-    end = math.ceil((tmax + 1) / WINDOW_SEC) * WINDOW_SEC
-    if end == start:
-        end = start + WINDOW_SEC
+    start, end = window_range(min(ts_list), max(ts_list))
 
-    windows={}
-    for wstart in range(int(start), int(end), WINDOW_SEC):
-        windows[wstart] = {
-            "window_start": wstart,
-            "window_end": wstart + WINDOW_SEC,
-            "controls_seen": {cid: 0 for cid in ["ID-LOG-01","ID-PUR-01","ID-MIN-01","ID-RET-01","ID-ACC-01"]},
-            "allow_count": 0,
-            "deny_count": 0,
-            "lat_ms_p50": None,
-            "lat_ms_p95": None,
-            "log_schema_ok": 0,
-            "log_schema_bad": 0,
-            "deletion_events": 0
-        }
-
-    lat_by_w = {k: [] for k in windows.keys()}
+    windows={wstart: empty_window(wstart) for wstart in range(start, end, WINDOW_SEC)}
+    lat_by_w = {k: QuantileSketch() for k in windows.keys()}
 
     for e in evs:
         t = extract_ts_event(e)
@@ -88,15 +161,14 @@ def main():
         elif allow is False:
             windows[wstart]["deny_count"] += 1
 
-        et = e.get("type","")
-        endpoint = "wallet/verify" if "wallet" in et else "onboarding/process" if "onboarding" in et else None
+        endpoint = event_endpoint(e)
         if endpoint:
             for cid in controls_for_endpoint(endpoint):
                 windows[wstart]["controls_seen"][cid] += 1
 
         dur = e.get("duration_ms")
         if isinstance(dur, (int,float)):
-            lat_by_w[wstart].append(float(dur))
+            lat_by_w[wstart].add(dur)
 
     # Best-effort logging schema checks from OPA logs (OPA log shape varies)
     for e in opa:
@@ -104,42 +176,288 @@ def main():
         wstart = int(math.floor(t / WINDOW_SEC) * WINDOW_SEC)
         if wstart not in windows:
             wstart = sorted(windows.keys())[-1]
-        inp = e.get("input")
-        if isinstance(inp, dict):
-            req = inp.get("request", {})
-            fields = set(req.get("log_fields", []) or [])
-            if REQUIRED_LOG_FIELDS.issubset(fields):
-                windows[wstart]["log_schema_ok"] += 1
-            else:
-                windows[wstart]["log_schema_bad"] += 1
+        ok, bad = decision_schema_counts(e)
+        windows[wstart]["log_schema_ok"] += ok
+        windows[wstart]["log_schema_bad"] += bad
 
-    if DEL_DIR.exists():
-        for p in DEL_DIR.glob("*.json"):
-            m = p.stat().st_mtime
-            wstart = int(math.floor(m / WINDOW_SEC) * WINDOW_SEC)
-            if wstart in windows:
-                windows[wstart]["deletion_events"] += 1
+    for wstart, n in deletion_counts(windows).items():
+        windows[wstart]["deletion_events"] += n
+
+    for wstart, sk in lat_by_w.items():
+        set_latency(windows[wstart], sk)
+
+    write_windows(windows_dir, windows)
+    print(f"Wrote {len(windows)} window summaries to {windows_dir}")
 
+KIND_WALLET, KIND_ONBOARDING = 1, 2
+
+# Typed columns for the events in [WINDOW_FROM, WINDOW_TO): ts (float64), kind (int8, 0 = no
+# endpoint), allow (int8, 1/0/-1 = true/false/other), dur (float64) and has_dur (bool)
+def load_columns(records):
+    import numpy as np
+    spec = {"ts": np.float64, "kind": np.int8, "allow": np.int8, "dur": np.float64, "has_dur": np.bool_}
+    parts = {k: [] for k in spec}
+    buf = {k: [] for k in spec}
+    kinds = {}
+
+    def flush():
+        for k, dt in spec.items():
+            parts[k].append(np.array(buf[k], dtype=dt))
+            buf[k].clear()
+
+    for e in records:
+        t = extract_ts_event(e)
+        if (WINDOW_FROM is not None and t < WINDOW_FROM) or (WINDOW_TO is not None and t >= WINDOW_TO):
+            continue
+        et = e.get("type","")
+        kind = kinds.get(et) if isinstance(et, str) else None
+        if kind is None:
+            endpoint = event_endpoint(e)
+            kind = KIND_WALLET if endpoint == "wallet/verify" else KIND_ONBOARDING if endpoint else 0
+            if isinstance(et, str):
+                kinds[et] = kind
+        allow = e.get("allow")
+        dur = e.get("duration_ms")
+        has_dur = isinstance(dur, (int,float))
+        buf["ts"].append(t)
+        buf["kind"].append(kind)
+        buf["allow"].append(1 if allow is True else 0 if allow is False else -1)
+        buf["dur"].append(float(dur) if has_dur else 0.0)
+        buf["has_dur"].append(has_dur)
+        if len(buf["ts"]) >= COLUMN_CHUNK:
+            flush()
+    flush()
+    return {k: np.concatenate(v) for k, v in parts.items()}
+
+def main_columnar():
+    import numpy as np
+    windows_dir = EVID / "monitoring" / "windows"
+    windows_dir.mkdir(parents=True, exist_ok=True)
+
+    cols = load_columns(iter_records(EVID, "events", WINDOW_FROM, WINDOW_TO))
+    opa_n = opa_ok = opa_bad = 0
+    for e in iter_records(EVID, "opa_decisions", WINDOW_FROM, WINDOW_TO):
+        ok, bad = decision_schema_counts(e)
+        opa_n += 1
+        opa_ok += ok
+        opa_bad += bad
+
+    ts = cols["ts"]
+    if opa_n == 0 and len(ts) == 0:
+        (windows_dir / "window_empty.json").write_text(json.dumps({"window_sec": WINDOW_SEC, "note":"no evidence"}, indent=2), encoding="utf-8")
+        return
+
+    if len(ts):
+        start, end = window_range(float(ts.min()), float(ts.max()))
+    else:
+        now = time.time()
+        start, end = window_range(now, now)
+    nwin = (end - start) // WINDOW_SEC
+    idx = (np.floor(ts / WINDOW_SEC) - start // WINDOW_SEC).astype(np.int64)
+
+    def per_window(mask):
+        return np.bincount(idx[mask], minlength=nwin)
+
+    allow_c = per_window(cols["allow"] == 1)
+    deny_c = per_window(cols["allow"] == 0)
+    wallet_c = per_window(cols["kind"] == KIND_WALLET)
+    onb_c = per_window(cols["kind"] == KIND_ONBOARDING)
+
+    # latencies grouped by window: sort on window index, then one sketch per window slice
+    lat_idx = idx[cols["has_dur"]]
+    order = np.argsort(lat_idx, kind="stable")
+    lat = cols["dur"][cols["has_dur"]][order]
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(lat_idx, minlength=nwin))))
+
+    windows = {}
+    for i in range(nwin):
+        wstart = start + i * WINDOW_SEC
+        w = empty_window(wstart)
+        w["allow_count"], w["deny_count"] = int(allow_c[i]), int(deny_c[i])
+        both = int(wallet_c[i] + onb_c[i])
+        w["controls_seen"] = {"ID-LOG-01": both, "ID-PUR-01": both, "ID-MIN-01": int(wallet_c[i]),
+                              "ID-RET-01": int(onb_c[i]), "ID-ACC-01": both}
+        lo, hi = bounds[i], bounds[i + 1]
+        if hi > lo:
+            sk = QuantileSketch()
+            sk.add_many(lat[lo:hi])
+            set_latency(w, sk)
+        windows[wstart] = w
+
+    if opa_n:
+        wstart = int(math.floor(time.time() / WINDOW_SEC) * WINDOW_SEC)
+        if wstart not in windows:
+            wstart = end - WINDOW_SEC
+        windows[wstart]["log_schema_ok"] += opa_ok
+        windows[wstart]["log_schema_bad"] += opa_bad
+
+    for wstart, n in deletion_counts(windows).items():
+        windows[wstart]["deletion_events"] += n
+
+    write_windows(windows_dir, windows)
+    print(f"Wrote {len(windows)} window summaries to {windows_dir}")
+
+def load_checkpoint(params: dict):
+    p = CHECKPOINT_DIR / "state.json"
     try:
-        import numpy as np
-        for wstart, arr in lat_by_w.items():
-            if arr:
-                a = np.array(arr)
-                windows[wstart]["lat_ms_p50"] = float(np.quantile(a, 0.5))
-                windows[wstart]["lat_ms_p95"] = float(np.quantile(a, 0.95))
+        st = json.loads(p.read_text(encoding="utf-8"))
     except Exception:
-        pass
+        st = None
+    if st is not None and st.get("params") == params:
+        # a tracked file that shrank or vanished was rewritten: start over
+        if all((EVID / k).exists() and (EVID / k).stat().st_size >= off for k, off in st["offsets"].items()):
+            return st
+    shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
+    return {"params": params, "offsets": {}, "tmin": None, "tmax": None, "aggs": {}, "total_sketch": None,
+            "opa_records": 0, "opa_ok": 0, "opa_bad": 0, "range": None, "opa_window": None, "deletions": {}}
 
-    rollup = {"window_sec": WINDOW_SEC, "windows": []}
-    for wstart in sorted(windows.keys()):
-        w = windows[wstart]
-        missing = [cid for cid, c in w["controls_seen"].items() if c == 0 and cid in ["ID-LOG-01","ID-PUR-01","ID-ACC-01"]]
-        w["missing_core_controls"] = missing
-        (windows_dir / f"window_{wstart}.json").write_text(json.dumps(w, indent=2), encoding="utf-8")
-        rollup["windows"].append(w)
+def empty_agg() -> dict:
+    return {"allow": 0, "deny": 0, "controls": {cid: 0 for cid in CONTROLS}, "sketch": None}
 
-    (windows_dir.parent / "rollup.json").write_text(json.dumps(rollup, indent=2), encoding="utf-8")
-    print(f"Wrote {len(windows)} window summaries to {windows_dir}")
+# Aggregates of an already written (closed) window, read back from the rollup store
+def reload_agg(store, wstart: int) -> dict:
+    a = empty_agg()
+    w = next((w for w in store.query(wstart, wstart + WINDOW_SEC, level=WINDOW_SEC) if w["window_start"] == wstart), None) if store else None
+    if w:
+        a["allow"], a["deny"] = w["allow_count"], w["deny_count"]
+        a["controls"] = {cid: w["controls_seen"].get(cid, 0) for cid in CONTROLS}
+        a["sketch"] = w.get("lat_sketch")
+    return a
+
+# Incremental run. The checkpoint holds per-file byte offsets, the aggregates (counters and
+# latency sketch) of windows still open to late events, the overall latency sketch and the
+# schema-check totals; closed windows live only in their written output. Each run builds
+# just the windows that changed, so its cost follows the new evidence, not the history.
+def main_incremental():
+    windows_dir = EVID / "monitoring" / "windows"
+    windows_dir.mkdir(parents=True, exist_ok=True)
+    st = load_checkpoint({"version": 3, "window_sec": WINDOW_SEC, "window_from": WINDOW_FROM, "window_to": WINDOW_TO})
+    fresh = st["range"] is None
+    store = None if fresh else open_store(EVID)
+    aggs = st["aggs"]
+    changed = set()
+    new_lat = {}
+
+    for p in logical_stream_files(EVID, "events", WINDOW_FROM, WINDOW_TO):
+        key = str(p.relative_to(EVID))
+        off = st["offsets"].get(key, 0)
+        for e, off in iter_jsonl_from(p, off):
+            t = extract_ts_event(e)
+            if (WINDOW_FROM is not None and t < WINDOW_FROM) or (WINDOW_TO is not None and t >= WINDOW_TO):
+                continue
+            st["tmin"] = t if st["tmin"] is None else min(st["tmin"], t)
+            st["tmax"] = t if st["tmax"] is None else max(st["tmax"], t)
+            wstart = int(math.floor(t / WINDOW_SEC) * WINDOW_SEC)
+            a = aggs.get(str(wstart))
+            if a is None:
+                # a window past its lateness bound was dropped from the checkpoint after being written
+                a = aggs[str(wstart)] = reload_agg(store, wstart)
+            changed.add(wstart)
+            allow = e.get("allow")
+            if allow is True:
+                a["allow"] += 1
+            elif allow is False:
+                a["deny"] += 1
+            endpoint = event_endpoint(e)
+            if endpoint:
+                for cid in controls_for_endpoint(endpoint):
+                    a["controls"][cid] += 1
+            dur = e.get("duration_ms")
+            if isinstance(dur, (int,float)):
+                new_lat.setdefault(wstart, []).append(float(dur))
+        st["offsets"][key] = off
+
+    opa_before = (st["opa_ok"], st["opa_bad"])
+    for p in logical_stream_files(EVID, "opa_decisions", WINDOW_FROM, WINDOW_TO):
+        key = str(p.relative_to(EVID))
+        off = st["offsets"].get(key, 0)
+        for e, off in iter_jsonl_from(p, off):
+            ok, bad = decision_schema_counts(e)
+            st["opa_records"] += 1
+            st["opa_ok"] += ok
+            st["opa_bad"] += bad
+        st["offsets"][key] = off
+
+    # adding a window's new latencies to the overall sketch equals re-merging every window
+    total = QuantileSketch.from_dict(st["total_sketch"]) if st["total_sketch"] else QuantileSketch()
+    for wstart, vals in new_lat.items():
+        a = aggs[str(wstart)]
+        sk = QuantileSketch.from_dict(a["sketch"]) if a["sketch"] else QuantileSketch()
+        sk.add_many(vals)
+        a["sketch"] = sk.to_dict()
+        total.add_many(vals)
+    st["total_sketch"] = total.to_dict() if total.count else None
+
+    if st["tmin"] is None and not st["opa_records"]:
+        (windows_dir / "window_empty.json").write_text(json.dumps({"window_sec": WINDOW_SEC, "note":"no evidence"}, indent=2), encoding="utf-8")
+        save_checkpoint(st)
+        return
+
+    now = time.time()
+    start, end = window_range(st["tmin"], st["tmax"]) if st["tmin"] is not None else window_range(now, now)
+    prev = st["range"] or [start, start]
+    changed |= {w for w in range(start, end, WINDOW_SEC) if not prev[0] <= w < prev[1]}
+    st["range"] = [start, end]
+
+    # schema checks land in the current window, or the last one when "now" is outside the range
+    opa_window = int(math.floor(now / WINDOW_SEC) * WINDOW_SEC)
+    if not start <= opa_window < end:
+        opa_window = end - WINDOW_SEC
+    if (st["opa_ok"], st["opa_bad"]) != opa_before or opa_window != st["opa_window"]:
+        changed |= {opa_window, st["opa_window"]}
+    st["opa_window"] = opa_window
+
+    dels = deletion_counts(range(start, end, WINDOW_SEC))
+    for wstart in set(dels) | {int(k) for k in st["deletions"]}:
+        if dels.get(wstart, 0) != st["deletions"].get(str(wstart), 0):
+            changed.add(wstart)
+    st["deletions"] = {str(k): v for k, v in dels.items()}
+
+    windows = {}
+    for wstart in sorted(w for w in changed if w is not None and start <= w < end):
+        w = empty_window(wstart)
+        a = aggs.get(str(wstart)) or reload_agg(store, wstart)
+        w["controls_seen"] = dict(a["controls"])
+        w["allow_count"], w["deny_count"] = a["allow"], a["deny"]
+        if a["sketch"]:
+            set_latency(w, QuantileSketch.from_dict(a["sketch"]))
+        if wstart == opa_window:
+            w["log_schema_ok"], w["log_schema_bad"] = st["opa_ok"], st["opa_bad"]
+        w["deletion_events"] = dels.get(wstart, 0)
+        windows[wstart] = w
+    written = write_window_files(windows_dir, windows)
+
+    # rollup.json lists every window: the previous listing with the changed windows replaced
+    prev_roll = None if fresh else read_rollup(windows_dir)
+    if prev_roll is None and store is not None:
+        prev_roll = {"windows": store.query(start, end, level=WINDOW_SEC)}
+    listing = {w["window_start"]: w for w in (prev_roll or {}).get("windows", []) if start <= w["window_start"] < end}
+    listing.update((w["window_start"], w) for w in written)
+    write_rollup(windows_dir, [listing[k] for k in sorted(listing)], total)
+
+    # written windows that can no longer receive events leave the checkpoint
+    horizon = st["tmax"] - LATENESS_SEC if st["tmax"] is not None else None
+    for k in [k for k in aggs if horizon is not None and int(k) + WINDOW_SEC <= horizon]:
+        del aggs[k]
+    save_checkpoint(st)
+    print(f"Wrote {len(written)} window summaries to {windows_dir} (incremental, {len(aggs)} open)")
+
+def read_rollup(windows_dir: Path):
+    try:
+        return json.loads((windows_dir.parent / "rollup.json").read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+def save_checkpoint(st: dict):
+    CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = CHECKPOINT_DIR / "state.json.tmp"
+    tmp.write_text(json.dumps(st), encoding="utf-8")
+    os.replace(tmp, CHECKPOINT_DIR / "state.json")
 
 if __name__ == "__main__":
-    main()
+    if INCREMENTAL:
+        main_incremental()
+    elif ENGINE == "numpy":
+        main_columnar()
+    else:
+        main()
@@ -0,0 +1,229 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from pathlib import Path
+import asyncio, gzip, hashlib, io, json, logging, os, re, tarfile, time
+
+log = logging.getLogger("eviid.bundle_server")
+
+# Serves the bundle store written by scripts/build_bundle.py (bundle/ in the repo):
+#   GET /<BUNDLE_RESOURCE>          active bundle, strong ETag = its sha256; If-None-Match -> 304.
+#                                   With `Prefer: wait=<s>` (OPA long polling) a request whose
+#                                   ETag is current is held until a new bundle is published.
+#                                   A client on the base of a ledger delta gets the delta bundle.
+#   GET /sha256/<digest>.tar.gz     immutable store entries
+#   POST /status                    OPA status reports (configs/opa_config.yaml `status:`)
+#   GET /activation                 waits until OPA reports a revision active
+BUNDLE_DIR = Path(os.getenv("BUNDLE_DIR", "/bundle"))
+BUNDLE_RESOURCE = os.getenv("BUNDLE_RESOURCE", "bundle.tar.gz")
+WATCH_INTERVAL = float(os.getenv("BUNDLE_WATCH_INTERVAL", "0.05"))
+MAX_WAIT = float(os.getenv("BUNDLE_MAX_WAIT", "60"))
+SERVE_DELTAS = os.getenv("BUNDLE_SERVE_DELTAS", "1") == "1"
+BUNDLE_MEDIA_TYPE = "application/vnd.openpolicyagent.bundles"
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def bundle_revision(raw: bytes):
+    try:
+        with tarfile.open(fileobj=io.BytesIO(raw), mode="r:gz") as tar:
+            for m in tar.getmembers():
+                if m.isfile() and m.name.removeprefix("./") == ".manifest":
+                    return json.loads(tar.extractfile(m).read()).get("revision")
+    except Exception:
+        return None
+    return None
+
+# base digest -> delta digest, for deltas whose target is `target`
+def load_deltas(target: str) -> dict[str, str]:
+    p = BUNDLE_DIR / "ledger.jsonl"
+    out = {}
+    if not p.exists():
+        return out
+    for line in p.read_text(encoding="utf-8").splitlines():
+        try:
+            e = json.loads(line)
+        except Exception:
+            continue
+        if e.get("type") == "delta" and e.get("target") == target:
+            out[e["base"]] = e["digest"]
+    return out
+
+class ActiveBundle:
+    def __init__(self):
+        self.raw: bytes | None = None
+        self.digest: str | None = None
+        self.revision: str | None = None
+        self.published_at: float | None = None
+        self.deltas: dict[str, str] = {}
+        self.changed = asyncio.Event()
+        self._sig = None
+
+    # reload when bundle.tar.gz was replaced (publish swaps the file atomically)
+    def poll(self) -> bool:
+        p = BUNDLE_DIR / BUNDLE_RESOURCE
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            return False
+        sig = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if sig == self._sig:
+            return False
+        self._sig = sig
+        raw = p.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest == self.digest:
+            return False
+        self.raw, self.digest, self.revision = raw, digest, bundle_revision(raw)
+        self.published_at = time.time()
+        self.deltas = load_deltas(digest) if SERVE_DELTAS else {}
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+        return True
+
+    def snapshot(self) -> dict:
+        return {"digest": self.digest, "revision": self.revision, "bytes": len(self.raw) if self.raw else 0,
+                "published_at": self.published_at, "deltas": len(self.deltas)}
+
+# Latest OPA status report per bundle, and an event that fires on every report
+class OpaStatus:
+    def __init__(self):
+        self.bundles: dict[str, dict] = {}
+        self.changed = asyncio.Event()
+
+    def report(self, body: dict):
+        for name, b in (body.get("bundles") or {}).items():
+            if not isinstance(b, dict):
+                continue
+            prev = self.bundles.get(name, {})
+            rev = b.get("active_revision")
+            self.bundles[name] = {"active_revision": rev, "errors": b.get("errors"), "code": b.get("code"),
+                                  "last_successful_activation": b.get("last_successful_activation"),
+                                  "seen_at": prev["seen_at"] if prev.get("active_revision") == rev else time.time()}
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def active(self, revision: str):
+        return next((b for b in self.bundles.values() if b.get("active_revision") == revision), None)
+
+active = ActiveBundle()
+opa = OpaStatus()
+stats = {"full": 0, "delta": 0, "not_modified": 0, "long_polls": 0, "long_poll_wakeups": 0, "status_reports": 0}
+
+# bundles are a few KiB, so stat-polling on the event loop is cheap and keeps the wakeups
+# (asyncio events) on the loop thread
+async def watch():
+    while True:
+        try:
+            active.poll()
+        except Exception as ex:
+            log.warning("bundle reload failed: %s", ex)
+        await asyncio.sleep(WATCH_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    active.poll()
+    task = asyncio.create_task(watch())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+app = FastAPI(title="EviID Bundle Server", lifespan=lifespan)
+
+def etags(header: str | None) -> set[str]:
+    if not header:
+        return set()
+    return {t.strip().removeprefix("W/").strip('"') for t in header.split(",") if t.strip()}
+
+def prefer_wait(header: str | None):
+    m = re.search(r"\bwait=(\d+(?:\.\d+)?)", header or "")
+    return min(float(m.group(1)), MAX_WAIT) if m else None
+
+def bundle_headers(digest: str) -> dict:
+    return {"ETag": f'"{digest}"', "Cache-Control": "no-cache"}
+
+@app.get("/health")
+def health():
+    return {"ok": True, "ts": time.time(), "active": active.snapshot(), "opa": opa.bundles, "stats": stats}
+
+@app.get("/" + BUNDLE_RESOURCE)
+async def bundle(request: Request):
+    if active.raw is None:
+        raise HTTPException(status_code=404, detail=f"no bundle published in {BUNDLE_DIR}")
+    known = etags(request.headers.get("if-none-match"))
+    wait = prefer_wait(request.headers.get("prefer"))
+    if active.digest in known and wait:
+        stats["long_polls"] += 1
+        try:
+            await asyncio.wait_for(active.changed.wait(), timeout=wait)
+            stats["long_poll_wakeups"] += 1
+        except asyncio.TimeoutError:
+            pass
+    raw, digest = active.raw, active.digest
+    if digest in known:
+        stats["not_modified"] += 1
+        return Response(status_code=304, headers=bundle_headers(digest), media_type=BUNDLE_MEDIA_TYPE)
+    delta = next((active.deltas[k] for k in known if k in active.deltas), None)
+    if delta is not None:
+        p = BUNDLE_DIR / "sha256" / f"{delta}.tar.gz"
+        if p.exists():
+            stats["delta"] += 1
+            return Response(await asyncio.to_thread(p.read_bytes), headers=bundle_headers(digest), media_type=BUNDLE_MEDIA_TYPE)
+    stats["full"] += 1
+    return Response(raw, headers=bundle_headers(digest), media_type=BUNDLE_MEDIA_TYPE)
+
+@app.get("/sha256/{name}")
+async def stored(name: str, request: Request):
+    digest = name.removesuffix(".tar.gz")
+    if not DIGEST_RE.match(digest) or name != f"{digest}.tar.gz":
+        raise HTTPException(status_code=404, detail="not a store entry")
+    headers = {"ETag": f'"{digest}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if digest in etags(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    p = BUNDLE_DIR / "sha256" / name
+    if not p.exists():
+        raise HTTPException(status_code=404, detail="unknown digest")
+    return Response(await asyncio.to_thread(p.read_bytes), headers=headers, media_type="application/gzip")
+
+# OPA status plugin target
+@app.post("/status")
+async def status(request: Request):
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        body = gzip.decompress(body)
+    try:
+        report = json.loads(body)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid status report")
+    stats["status_reports"] += 1
+    opa.report(report if isinstance(report, dict) else {})
+    return {"ok": True}
+
+# Wait (up to `timeout` s) until OPA reports `revision` active - by default the revision of
+# the bundle being served, or of the store entry `digest`. 408 if it does not happen in time.
+@app.get("/activation")
+async def activation(revision: str | None = None, digest: str | None = None,
+                     timeout: float = Query(30.0, ge=0, le=600)):
+    if revision is None:
+        if digest is None or digest == active.digest:
+            revision = active.revision
+        else:
+            p = BUNDLE_DIR / "sha256" / f"{digest}.tar.gz"
+            if not DIGEST_RE.match(digest) or not p.exists():
+                raise HTTPException(status_code=404, detail="unknown digest")
+            revision = bundle_revision(await asyncio.to_thread(p.read_bytes))
+    if revision is None:
+        raise HTTPException(status_code=404, detail="no bundle revision to wait for")
+    t0 = time.monotonic()
+    deadline = t0 + timeout
+    while (b := opa.active(revision)) is None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return Response(json.dumps({"activated": False, "revision": revision, "opa": opa.bundles}),
+                            status_code=408, media_type="application/json")
+        try:
+            await asyncio.wait_for(opa.changed.wait(), timeout=remaining)
+        except asyncio.TimeoutError:
+            pass
+    return {"activated": True, "revision": revision, "waited_ms": (time.monotonic() - t0) * 1000.0,
+            "last_successful_activation": b.get("last_successful_activation"),
+            "published_at": active.published_at if revision == active.revision else None,
+            "seen_at": b.get("seen_at")}
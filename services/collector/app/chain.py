@@ -0,0 +1,92 @@
+import hashlib, json, os, time
+from pathlib import Path
+
+GENESIS = "0" * 64
+
+def chain_step(root: str, line: bytes) -> str:
+    return hashlib.sha256(bytes.fromhex(root) + hashlib.sha256(line).digest()).hexdigest()
+
+# Append-only hash chain over the records (lines) of one stream:
+#   root_0 = GENESIS, root_i = sha256(root_{i-1} || sha256(line_i))
+# Checkpoints (root, record count, stream byte count, file + offset of the next record)
+# are appended to <dir>/<stream>.checkpoints.jsonl so verifiers only rehash what is new.
+class HashChain:
+    def __init__(self, stream: str, directory: Path, every_records: int = 1000, every_sec: float = 5.0):
+        self.stream = stream
+        self.path = Path(directory) / f"{stream}.checkpoints.jsonl"
+        self.every_records = every_records
+        self.every_sec = every_sec
+        self.root = GENESIS
+        self.records = 0
+        self.bytes = 0
+        self.checkpoints = 0
+        self._last_cp_records = 0
+        self._last_cp_time = time.monotonic()
+        self._partial = b""
+
+    def last_checkpoint(self):
+        if not self.path.exists():
+            return None
+        last = None
+        with self.path.open("rb") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        last = json.loads(line)
+                    except Exception:
+                        pass
+        return last
+
+    # files: the stream's files oldest first; re-chains whatever was written after the last checkpoint
+    def recover(self, files: list[Path]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        cp = self.last_checkpoint()
+        start_file, start_off = None, 0
+        if cp:
+            self.root, self.records, self.bytes = cp["root"], cp["records"], cp["bytes"]
+            self.checkpoints = cp["seq"]
+            start_file, start_off = cp.get("file"), cp.get("file_offset", 0)
+        names = [p.name for p in files]
+        idx = 0
+        if cp and start_file in names:
+            idx = names.index(start_file)
+        elif cp:
+            # segment names sort by sequence; an emptied segment may have been removed
+            idx = next((i for i, n in enumerate(names) if n >= start_file), len(names))
+        for p in files[idx:]:
+            with p.open("rb") as f:
+                if cp and p.name == start_file:
+                    f.seek(start_off)
+                for line in f:
+                    self.update(line)
+        self._last_cp_records = self.records
+
+    def update(self, data: bytes):
+        if self._partial:
+            data, self._partial = self._partial + data, b""
+        # records end at b"\n" only (as in the verifier); a bare b"\r" is record content
+        *lines, self._partial = data.split(b"\n")
+        for line in lines:
+            line += b"\n"
+            self.root = chain_step(self.root, line)
+            self.records += 1
+            self.bytes += len(line)
+
+    def maybe_checkpoint(self, file: Path, offset: int, force: bool = False):
+        new = self.records - self._last_cp_records
+        if new == 0 or not (force or new >= self.every_records
+                            or time.monotonic() - self._last_cp_time >= self.every_sec):
+            return None
+        self.checkpoints += 1
+        cp = {"stream": self.stream, "seq": self.checkpoints, "records": self.records, "bytes": self.bytes,
+              "root": self.root, "file": Path(file).name, "file_offset": offset, "ts": time.time()}
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(cp) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._last_cp_records = self.records
+        self._last_cp_time = time.monotonic()
+        return cp
+
+    def snapshot(self) -> dict:
+        return {"root": self.root, "records": self.records, "bytes": self.bytes, "checkpoints": self.checkpoints}
@@ -0,0 +1,119 @@
+import json, zlib
+
+GZIP_MAGIC = b"\x1f\x8b"
+MAX_CHUNK_OUT = 256 * 1024  # cap on bytes inflated per step
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+# Streaming inflater for a request body; output per step is capped so a
+# multi-megabyte upload never has to be materialized.
+class BodyDecoder:
+    def __init__(self, content_encoding: str | None):
+        enc = (content_encoding or "identity").strip().lower()
+        if enc not in ("identity", "gzip", "x-gzip", "deflate"):
+            raise UnsupportedEncoding(enc)
+        self.encoding = enc
+        self._z = None
+        if enc in ("gzip", "x-gzip"):
+            self._z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif enc == "deflate":
+            self._z = zlib.decompressobj(zlib.MAX_WBITS)
+        self._sniffed = enc != "identity"
+
+    def feed(self, chunk: bytes):
+        # OPA always gzips decision logs; accept them even if a proxy dropped the header
+        if not self._sniffed:
+            self._sniffed = True
+            if chunk[:2] == GZIP_MAGIC:
+                self._z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._z is None:
+            yield chunk
+            return
+        data = chunk
+        while data:
+            out = self._z.decompress(data, MAX_CHUNK_OUT)
+            if out:
+                yield out
+            data = self._z.unconsumed_tail
+
+    def flush(self):
+        if self._z is not None:
+            out = self._z.flush()
+            if out:
+                yield out
+
+# Incremental parser for a JSON array of decisions (or a single decision object).
+# Holds at most one partially received decision in memory.
+class DecisionStreamParser:
+    def __init__(self):
+        self._dec = json.JSONDecoder()
+        self._buf = ""
+        self._tail = b""
+        self._state = "start"  # start -> items -> done (array) | single (object)
+
+    def feed(self, data: bytes) -> list:
+        data = self._tail + data
+        try:
+            text = data.decode("utf-8")
+            self._tail = b""
+        except UnicodeDecodeError as ex:
+            if ex.start < len(data) - 3:
+                raise
+            # multi-byte character split across chunks
+            text, self._tail = data[:ex.start].decode("utf-8"), data[ex.start:]
+        self._buf += text
+        return self._drain(final=False)
+
+    def close(self) -> list:
+        if self._tail:
+            raise ValueError("truncated UTF-8 sequence at end of body")
+        out = self._drain(final=True)
+        if self._state not in ("done", "single_done") or self._buf.strip():
+            raise ValueError("incomplete or trailing data in decision log upload")
+        return out
+
+    def _drain(self, final: bool) -> list:
+        out = []
+        buf, pos, n = self._buf, 0, len(self._buf)
+        while True:
+            while pos < n and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos >= n:
+                break
+            if self._state == "start":
+                if buf[pos] == "[":
+                    self._state = "items"
+                    pos += 1
+                    continue
+                self._state = "single"
+            if self._state in ("done", "single_done"):
+                break
+            if self._state == "items":
+                c = buf[pos]
+                if c == ",":
+                    pos += 1
+                    continue
+                if c == "]":
+                    self._state = "done"
+                    pos += 1
+                    continue
+            try:
+                obj, end = self._dec.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break  # wait for more bytes
+            if end == n and not final and self._state == "items":
+                # a number/literal could continue in the next chunk; objects cannot, but be safe
+                if buf[pos] not in "{[\"":
+                    break
+            out.append(obj)
+            pos = end
+            if self._state == "single":
+                self._state = "single_done"
+        self._buf = buf[pos:]
+        return out
+
+def normalize(decision) -> str:
+    return json.dumps(decision, separators=(",", ":"), ensure_ascii=False)
@@ -1,8 +1,13 @@
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from pathlib import Path
-import time, hashlib
+import asyncio, fcntl, os, tempfile, time, hashlib, json, zlib
 
-app = FastAPI(title="EviID Evidence Collector")
+from app.chain import HashChain
+from app.decisions import BodyDecoder, DecisionStreamParser, UnsupportedEncoding, normalize
+from app.segments import SegmentSink, record_meta
+from app.windows import WindowAggregator, decision_schema_counts, query_windows
+from app.writer import StreamWriter
 
 OUT = Path("/app/out")
 EVID = OUT / "evidence"
@@ -10,27 +15,201 @@ EVID.mkdir(parents=True, exist_ok=True)
 OPA_LOG = EVID / "opa_decisions.jsonl"
 EVENTS = EVID / "events.jsonl"
 
+FLUSH_INTERVAL = float(os.getenv("COLLECTOR_FLUSH_INTERVAL", "0.001"))
+FLUSH_MAX_RECORDS = int(os.getenv("COLLECTOR_FLUSH_MAX_RECORDS", "1000"))
+FSYNC = os.getenv("COLLECTOR_FSYNC", "none")  # none | batch | interval
+FSYNC_INTERVAL = float(os.getenv("COLLECTOR_FSYNC_INTERVAL", "1"))
+DECISION_WRITE_CHUNK = int(os.getenv("COLLECTOR_DECISION_WRITE_CHUNK", "500"))
+# parsed uploads are held in memory up to this size, beyond it in a temporary file
+DECISION_SPOOL_BYTES = int(os.getenv("COLLECTOR_DECISION_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# Segmented layout: evidence/segments/<stream>/<stream>-<seq>-<opened>.jsonl (+ .manifest.json)
+SEGMENTS = os.getenv("COLLECTOR_SEGMENTS", "0") == "1"
+SEGMENT_DIR = EVID / "segments"
+SEGMENT_MAX_BYTES = int(os.getenv("COLLECTOR_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+SEGMENT_WINDOW_SEC = int(os.getenv("COLLECTOR_SEGMENT_WINDOW_SEC", "3600"))
+
+# Hash chain over every stream with checkpoints in evidence/chain/<stream>.checkpoints.jsonl
+CHAIN = os.getenv("COLLECTOR_CHAIN", "1") == "1"
+CHAIN_DIR = EVID / "chain"
+CHAIN_CHECKPOINT_RECORDS = int(os.getenv("COLLECTOR_CHAIN_CHECKPOINT_RECORDS", "1000"))
+CHAIN_CHECKPOINT_SEC = float(os.getenv("COLLECTOR_CHAIN_CHECKPOINT_SEC", "5"))
+
+# Live window aggregation (window_summarizer's schema) over arriving events and decision logs;
+# closed windows go to evidence/monitoring/live/windows_<sec>[.<shard>].jsonl
+LIVE_WINDOWS = os.getenv("COLLECTOR_WINDOWS", "1") == "1"
+LIVE_DIR = EVID / "monitoring" / "live"
+LIVE_WINDOW_SEC = int(os.getenv("COLLECTOR_WINDOW_SEC", "60"))
+LIVE_LATENESS_SEC = float(os.getenv("COLLECTOR_WINDOW_LATENESS_SEC", "30"))
+
+# Multi-worker mode (uvicorn --workers N): each worker process claims a shard id by locking
+# evidence/shards/worker-<id>.lock and writes <stream>.<id>.jsonl (or segments/<stream>.<id>/),
+# with its own hash chain, so no two processes ever append to the same file.
+# Readers merge the shards back into one stream (scripts/lib/evidence.py).
+WORKERS = int(os.getenv("COLLECTOR_WORKERS", "1"))
+SHARD_DIR = EVID / "shards"
+
+def claim_shard():
+    SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    while True:
+        for i in range(WORKERS):
+            f = (SHARD_DIR / f"worker-{i}.lock").open("a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            return i, f
+        time.sleep(0.1)  # a previous worker is still shutting down
+
+def make_writer(stream: str, path: Path) -> StreamWriter:
+    sink = SegmentSink(SEGMENT_DIR / stream, stream, max_bytes=SEGMENT_MAX_BYTES,
+                       window_sec=SEGMENT_WINDOW_SEC) if SEGMENTS else None
+    chain = HashChain(stream, CHAIN_DIR, every_records=CHAIN_CHECKPOINT_RECORDS,
+                      every_sec=CHAIN_CHECKPOINT_SEC) if CHAIN else None
+    return StreamWriter(path, flush_interval=FLUSH_INTERVAL, max_records=FLUSH_MAX_RECORDS,
+                        fsync=FSYNC, fsync_interval=FSYNC_INTERVAL, sink=sink, chain=chain)
+
+writers: dict[str, StreamWriter] = {}
+shard = {"id": None}
+live = {"agg": None}
+
+async def advance_windows(agg: WindowAggregator):
+    while True:
+        await asyncio.sleep(1.0)
+        agg.advance()
+        await asyncio.to_thread(agg.persist, agg.drain())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lock = None
+    if WORKERS > 1:
+        shard["id"], lock = claim_shard()
+        writers.update({s: make_writer(f"{s}.{shard['id']}", EVID / f"{s}.{shard['id']}.jsonl")
+                        for s in ("opa_decisions", "events")})
+    else:
+        writers.update({"opa_decisions": make_writer("opa_decisions", OPA_LOG), "events": make_writer("events", EVENTS)})
+    for w in writers.values():
+        await w.start()
+    ticker = None
+    if LIVE_WINDOWS:
+        agg = live["agg"] = WindowAggregator(LIVE_DIR, LIVE_WINDOW_SEC, LIVE_LATENESS_SEC, shard=shard["id"])
+        await asyncio.to_thread(agg.start)
+        ticker = asyncio.create_task(advance_windows(agg))
+    try:
+        yield
+    finally:
+        if ticker is not None:
+            ticker.cancel()
+            agg = live["agg"]
+            agg.advance()
+            await asyncio.to_thread(agg.persist, agg.drain())
+            await asyncio.to_thread(agg.save_open)
+            live["agg"] = None
+        for w in writers.values():
+            await w.close()
+        writers.clear()
+        if lock is not None:
+            lock.close()
+
+app = FastAPI(title="EviID Evidence Collector", lifespan=lifespan)
+
 def sha256_bytes(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
 
 @app.get("/health")
 def health():
-    return {"ok": True, "ts": time.time()}
+    return {"ok": True, "ts": time.time(), "shard": shard["id"], "writers": {k: w.snapshot() for k, w in writers.items()},
+            "windows": live["agg"].snapshot() if live["agg"] else None}
 
-# OPA decision logs POST to the service base URL
+# Closed windows overlapping [from, to) (epoch seconds), merged across collector workers
+@app.get("/windows")
+async def windows(t_from: float | None = Query(None, alias="from"), t_to: float | None = Query(None, alias="to")):
+    if not LIVE_WINDOWS:
+        raise HTTPException(status_code=404, detail="live windows disabled (COLLECTOR_WINDOWS=0)")
+    ws = await asyncio.to_thread(query_windows, LIVE_DIR, LIVE_WINDOW_SEC, t_from, t_to)
+    return {"window_sec": LIVE_WINDOW_SEC, "windows": ws}
+
+# Windows this worker still has open (not yet past the watermark)
+@app.get("/windows/current")
+def windows_current():
+    agg = live["agg"]
+    if agg is None:
+        raise HTTPException(status_code=404, detail="live windows disabled (COLLECTOR_WINDOWS=0)")
+    return {"window_sec": agg.window_sec, "shard": shard["id"], "watermark": agg.watermark(), "windows": agg.current()}
+
+# OPA decision logs POST to the service base URL as (gzipped) JSON arrays.
+# The body is inflated and parsed as it streams in, spooled one decision per line, and
+# written only once the whole upload has parsed: a rejected upload leaves no records behind,
+# so OPA's retry of it cannot duplicate decisions.
 @app.post("/")
 @app.post("/v1/data")
 async def opa_decision_log(req: Request):
-    payload = await req.body()
-    line = payload.decode("utf-8").strip()
-    with OPA_LOG.open("a", encoding="utf-8") as f:
-        f.write(line + "\n")
-    return {"received": True, "sha256": sha256_bytes(payload)}
+    try:
+        decoder = BodyDecoder(req.headers.get("content-encoding"))
+    except UnsupportedEncoding as ex:
+        raise HTTPException(status_code=415, detail=f"unsupported Content-Encoding: {ex}")
+    parser = DecisionStreamParser()
+    h = hashlib.sha256()
+    meta, schema = [], []
+
+    with tempfile.SpooledTemporaryFile(max_size=DECISION_SPOOL_BYTES) as spool:
+        def spool_all(decisions):
+            for d in decisions:
+                spool.write((normalize(d) + "\n").encode("utf-8"))
+                meta.append(record_meta("opa_decisions", d))
+                if live["agg"]:
+                    schema.append(decision_schema_counts(d))
+
+        try:
+            async for chunk in req.stream():
+                h.update(chunk)
+                for data in decoder.feed(chunk):
+                    spool_all(parser.feed(data))
+            for data in decoder.flush():
+                spool_all(parser.feed(data))
+            spool_all(parser.close())
+        except (ValueError, zlib.error) as ex:
+            raise HTTPException(status_code=400, detail=f"malformed decision log upload after {len(meta)} decisions: {ex}")
+
+        spool.seek(0)
+        for i in range(0, len(meta), DECISION_WRITE_CHUNK):
+            chunk_meta = meta[i:i + DECISION_WRITE_CHUNK]
+            lines = b"".join(spool.readline() for _ in chunk_meta)
+            await writers["opa_decisions"].append(lines, records=len(chunk_meta), meta=chunk_meta)
+    if live["agg"]:
+        for ok, bad in schema:
+            live["agg"].observe_decision_schema(ok, bad)
+    return {"received": True, "decisions": len(meta), "sha256": h.hexdigest()}
 
 @app.post("/event")
 async def event(req: Request):
     payload = await req.body()
     line = payload.decode("utf-8").strip()
-    with EVENTS.open("a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    try:
+        rec = json.loads(line)
+        meta = [record_meta("events", rec)]
+    except Exception:
+        rec, meta = None, None
+    await writers["events"].append((line + "\n").encode("utf-8"), meta=meta)
+    if live["agg"]:
+        live["agg"].observe_event(rec)
     return {"received": True, "sha256": sha256_bytes(payload)}
+
+# Bulk ingestion: JSON array of events from the identity API's batched emitter
+@app.post("/event/batch")
+async def event_batch(req: Request):
+    payload = await req.body()
+    try:
+        events = json.loads(payload)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid JSON")
+    if not isinstance(events, list):
+        raise HTTPException(status_code=400, detail="expected a JSON array of events")
+    lines = "".join(json.dumps(e) + "\n" for e in events)
+    await writers["events"].append(lines.encode("utf-8"), records=len(events),
+                                   meta=[record_meta("events", e) for e in events])
+    if live["agg"]:
+        for e in events:
+            live["agg"].observe_event(e)
+    return {"received": len(events), "sha256": sha256_bytes(payload)}
@@ -0,0 +1,201 @@
+import hashlib, json, os, re, time
+from datetime import datetime
+from pathlib import Path
+
+MANIFEST_SUFFIX = ".manifest.json"
+SEGMENT_RE = re.compile(r"^(?P<stream>[\w.-]+?)-(?P<seq>\d{8})-(?P<opened>\d+)\.jsonl$")
+
+def parse_ts(v) -> float | None:
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return float(v)
+    if isinstance(v, str):
+        # OPA uses RFC3339 with nanoseconds; fromisoformat takes at most microseconds
+        m = re.match(r"^(.*T\d\d:\d\d:\d\d)(\.\d+)?(Z|[+-]\d\d:\d\d)?$", v)
+        if m:
+            frac = (m.group(2) or "")[:7]
+            tz = m.group(3) or "Z"
+            try:
+                return datetime.fromisoformat(m.group(1) + frac + ("+00:00" if tz == "Z" else tz)).timestamp()
+            except ValueError:
+                return None
+    return None
+
+def event_endpoint(etype: str) -> str | None:
+    return "wallet/verify" if "wallet" in etype else "onboarding/process" if "onboarding" in etype else None
+
+# (ts, type, [endpoints]) for one record; used for the segment sidecar counts
+def record_meta(stream: str, rec) -> tuple:
+    if not isinstance(rec, dict):
+        return None, None, []
+    if stream.startswith("opa_decisions"):
+        inp = rec.get("input") if isinstance(rec.get("input"), dict) else {}
+        reqs = inp["requests"] if isinstance(inp.get("requests"), list) else [inp.get("request") or {}]
+        eps = [r.get("endpoint") for r in reqs if isinstance(r, dict) and r.get("endpoint")]
+        return parse_ts(rec.get("timestamp")), rec.get("path") or "decision", eps
+    etype = rec.get("type") or ""
+    ep = rec.get("endpoint") or event_endpoint(etype)
+    return parse_ts(rec.get("ts")), etype or None, [ep] if ep else []
+
+class SegmentStats:
+    def __init__(self):
+        self.records = 0
+        self.bytes = 0
+        self.ts_min = None
+        self.ts_max = None
+        self.types: dict[str, int] = {}
+        self.endpoints: dict[str, int] = {}
+        self.sha = hashlib.sha256()
+
+    def add(self, data: bytes, meta: list):
+        self.bytes += len(data)
+        self.sha.update(data)
+        for ts, etype, eps in meta:
+            self.records += 1
+            if ts is not None:
+                self.ts_min = ts if self.ts_min is None else min(self.ts_min, ts)
+                self.ts_max = ts if self.ts_max is None else max(self.ts_max, ts)
+            if etype:
+                self.types[etype] = self.types.get(etype, 0) + 1
+            for ep in eps:
+                self.endpoints[ep] = self.endpoints.get(ep, 0) + 1
+
+# Appends to a single long-lived file (the original layout).
+class FileSink:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._f = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self.path.open("ab")
+
+    def write(self, data: bytes, meta: list):
+        if data:
+            self._f.write(data)
+
+    def flush(self, sync: bool):
+        self._f.flush()
+        if sync:
+            os.fsync(self._f.fileno())
+
+    def files(self) -> list[Path]:
+        return [self.path] if self.path.exists() else []
+
+    def position(self) -> tuple[Path, int]:
+        return self.path, self._f.tell()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+# Rotating segments <dir>/<stream>-<seq>-<opened>.jsonl, rolled by size or wall-clock
+# window. Each closed segment gets a <segment>.manifest.json sidecar.
+class SegmentSink:
+    def __init__(self, directory: Path, stream: str, max_bytes: int = 64 * 1024 * 1024, window_sec: int = 3600):
+        self.dir = Path(directory)
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.window_sec = window_sec
+        self.seq = 0
+        self.path: Path | None = None
+        self._f = None
+        self._stats: SegmentStats | None = None
+        self._window = None
+        self._opened = None
+
+    def open(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        for p in sorted(self.dir.glob(f"{self.stream}-*.jsonl")):
+            m = SEGMENT_RE.match(p.name)
+            if not m or m.group("stream") != self.stream:
+                continue
+            self.seq = max(self.seq, int(m.group("seq")))
+            if not manifest_path(p).exists():
+                self._recover(p)  # left open by a previous process
+        self._roll()
+
+    def _recover(self, p: Path):
+        st = SegmentStats()
+        with p.open("rb") as f:
+            for line in f:
+                try:
+                    meta = [record_meta(self.stream, json.loads(line))] if line.strip() else []
+                except Exception:
+                    meta = [(None, None, [])]
+                st.add(line, meta)
+        opened = int(SEGMENT_RE.match(p.name).group("opened"))
+        self._write_manifest(p, st, opened, p.stat().st_mtime)
+
+    def _roll(self):
+        if self._f is not None:
+            self._close_segment()
+        now = time.time()
+        self.seq += 1
+        self._opened = int(now)
+        self._window = int(now // self.window_sec) if self.window_sec > 0 else None
+        self.path = self.dir / f"{self.stream}-{self.seq:08d}-{self._opened}.jsonl"
+        self._f = self.path.open("ab")
+        self._stats = SegmentStats()
+
+    def _close_segment(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        self._f = None
+        self._write_manifest(self.path, self._stats, self._opened, time.time())
+
+    def _write_manifest(self, p: Path, st: SegmentStats, opened: float, closed: float):
+        m = SEGMENT_RE.match(p.name)
+        man = {
+            "stream": self.stream,
+            "segment": p.name,
+            "seq": int(m.group("seq")),
+            "opened_at": opened,
+            "closed_at": closed,
+            "ts_min": st.ts_min,
+            "ts_max": st.ts_max,
+            "records": st.records,
+            "bytes": st.bytes,
+            "sha256": st.sha.hexdigest(),
+            "types": st.types,
+            "endpoints": st.endpoints,
+        }
+        tmp = manifest_path(p).with_suffix(".tmp")
+        tmp.write_text(json.dumps(man, indent=2), encoding="utf-8")
+        os.replace(tmp, manifest_path(p))
+
+    def write(self, data: bytes, meta: list):
+        if not data:
+            return
+        if self._stats.bytes > 0 and (
+                self._stats.bytes + len(data) > self.max_bytes
+                or (self._window is not None and int(time.time() // self.window_sec) != self._window)):
+            self._roll()
+        self._f.write(data)
+        self._stats.add(data, meta)
+
+    def flush(self, sync: bool):
+        self._f.flush()
+        if sync:
+            os.fsync(self._f.fileno())
+
+    def files(self) -> list[Path]:
+        return [p for p in sorted(self.dir.glob(f"{self.stream}-*.jsonl"))
+                if (m := SEGMENT_RE.match(p.name)) and m.group("stream") == self.stream]
+
+    def position(self) -> tuple[Path, int]:
+        return self.path, self._f.tell()
+
+    def close(self):
+        if self._f is None:
+            return
+        if self._stats.bytes > 0:
+            self._close_segment()
+        else:
+            self._f.close()
+            self._f = None
+            self.path.unlink(missing_ok=True)
+
+def manifest_path(segment: Path) -> Path:
+    return segment.with_name(segment.name + MANIFEST_SUFFIX)
@@ -0,0 +1,96 @@
+import math
+from bisect import bisect_left
+
+# Collector-side copy of scripts/lib/sketch.py (same buckets and serialized form, no NumPy).
+# DDSketch-style mergeable quantile sketch for latencies (ms). Positive values fall into
+# log-spaced buckets (gamma^(k-1), gamma^k] with gamma = (1 + alpha) / (1 - alpha); reporting
+# 2 * gamma^k / (gamma + 1) for a bucket keeps every quantile within relative error alpha of
+# the true value for values inside [MIN_VALUE, MAX_VALUE]. Values <= 0 are counted as zero.
+# Sketches with the same alpha merge by adding bucket counts.
+DEFAULT_ALPHA = 0.01
+MIN_VALUE = 1e-6
+MAX_VALUE = 1e7
+
+_BOUNDS: dict[float, list[float]] = {}
+
+def _bounds(alpha: float) -> list[float]:
+    b = _BOUNDS.get(alpha)
+    if b is None:
+        gamma = (1 + alpha) / (1 - alpha)
+        lo = math.floor(math.log(MIN_VALUE) / math.log(gamma))
+        hi = math.ceil(math.log(MAX_VALUE) / math.log(gamma))
+        b = _BOUNDS[alpha] = [gamma ** k for k in range(lo, hi + 1)]
+    return b
+
+class QuantileSketch:
+    def __init__(self, alpha: float = DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._b = _bounds(alpha)
+        self.counts: dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, x: float):
+        x = float(x)
+        self.count += 1
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        if x <= 0:
+            self.zero += 1
+            return
+        i = min(bisect_left(self._b, x), len(self._b) - 1)
+        self.counts[i] = self.counts.get(i, 0) + 1
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.alpha != self.alpha:
+            raise ValueError(f"cannot merge sketches with alpha {self.alpha} and {other.alpha}")
+        for k, c in other.counts.items():
+            self.counts[k] = self.counts.get(k, 0) + c
+        self.zero += other.zero
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.counts):
+            seen += self.counts[k]
+            if seen > rank:
+                v = 2 * self._b[k] / (self.gamma + 1)
+                return min(max(v, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        keys = sorted(k for k, c in self.counts.items() if c)
+        return {
+            "alpha": self.alpha,
+            "count": self.count,
+            "zero": self.zero,
+            "min": self.min,
+            "max": self.max,
+            "offset": keys[0] if keys else 0,
+            "bins": [self.counts.get(k, 0) for k in range(keys[0], keys[-1] + 1)] if keys else [],
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "QuantileSketch":
+        s = cls(d.get("alpha", DEFAULT_ALPHA))
+        s.count, s.zero, s.min, s.max = d["count"], d["zero"], d["min"], d["max"]
+        s.counts = {d["offset"] + i: c for i, c in enumerate(d["bins"]) if c}
+        return s
+
+def merge_all(sketches, alpha: float = DEFAULT_ALPHA) -> QuantileSketch:
+    out = QuantileSketch(alpha)
+    for s in sketches:
+        out.merge(QuantileSketch.from_dict(s) if isinstance(s, dict) else s)
+    return out
@@ -0,0 +1,235 @@
+import json, math, time
+from pathlib import Path
+
+from app.sketch import QuantileSketch, merge_all
+
+# Same window schema as scripts/monitoring/window_summarizer.py, maintained as records arrive
+CONTROLS = ["ID-LOG-01","ID-PUR-01","ID-MIN-01","ID-RET-01","ID-ACC-01"]
+CORE_CONTROLS = ["ID-LOG-01","ID-PUR-01","ID-ACC-01"]
+REQUIRED_LOG_FIELDS = {"control_id","policy_bundle_digest","release_id","environment_id","decision_id","timestamp"}
+
+def controls_for_endpoint(endpoint: str):
+    base = {"ID-LOG-01","ID-PUR-01","ID-ACC-01"}
+    if endpoint == "wallet/verify":
+        base.add("ID-MIN-01")
+    if endpoint == "onboarding/process":
+        base.add("ID-RET-01")
+    return base
+
+def decision_schema_counts(rec) -> tuple[int, int]:
+    ok = bad = 0
+    inp = rec.get("input") if isinstance(rec, dict) else None
+    if isinstance(inp, dict):
+        reqs = inp.get("requests") if isinstance(inp.get("requests"), list) else [inp.get("request", {})]
+        for req in reqs:
+            fields = set((req or {}).get("log_fields", []) or [])
+            if REQUIRED_LOG_FIELDS.issubset(fields):
+                ok += 1
+            else:
+                bad += 1
+    return ok, bad
+
+class Window:
+    def __init__(self, start: int, window_sec: int):
+        self.start = start
+        self.end = start + window_sec
+        self.controls = {cid: 0 for cid in CONTROLS}
+        self.allow = 0
+        self.deny = 0
+        self.sketch = QuantileSketch()
+        self.schema_ok = 0
+        self.schema_bad = 0
+
+    def add_event(self, e: dict):
+        allow = e.get("allow")
+        if allow is True:
+            self.allow += 1
+        elif allow is False:
+            self.deny += 1
+        et = e.get("type") or ""
+        endpoint = "wallet/verify" if "wallet" in et else "onboarding/process" if "onboarding" in et else None
+        if endpoint:
+            for cid in controls_for_endpoint(endpoint):
+                self.controls[cid] += 1
+        dur = e.get("duration_ms")
+        if isinstance(dur, (int, float)):
+            self.sketch.add(dur)
+
+    def to_dict(self) -> dict:
+        return finalize({
+            "window_start": self.start,
+            "window_end": self.end,
+            "controls_seen": dict(self.controls),
+            "allow_count": self.allow,
+            "deny_count": self.deny,
+            "lat_ms_p50": None,
+            "lat_ms_p95": None,
+            "lat_ms_p99": None,
+            "lat_sketch": self.sketch.to_dict() if self.sketch.count else None,
+            "log_schema_ok": self.schema_ok,
+            "log_schema_bad": self.schema_bad,
+            "deletion_events": 0
+        })
+
+    @classmethod
+    def from_dict(cls, d: dict, window_sec: int) -> "Window":
+        w = cls(d["window_start"], window_sec)
+        w.controls.update(d["controls_seen"])
+        w.allow, w.deny = d["allow_count"], d["deny_count"]
+        if d.get("lat_sketch"):
+            w.sketch = QuantileSketch.from_dict(d["lat_sketch"])
+        w.schema_ok, w.schema_bad = d["log_schema_ok"], d["log_schema_bad"]
+        return w
+
+# percentiles from the sketch and the missing core controls, as the summarizer reports them
+def finalize(w: dict) -> dict:
+    if w.get("lat_sketch"):
+        sk = QuantileSketch.from_dict(w["lat_sketch"])
+        w["lat_ms_p50"], w["lat_ms_p95"], w["lat_ms_p99"] = sk.quantile(0.5), sk.quantile(0.95), sk.quantile(0.99)
+    w["missing_core_controls"] = [cid for cid, c in w["controls_seen"].items() if c == 0 and cid in CORE_CONTROLS]
+    return w
+
+# Merge the same window reported by several collector workers
+def merge_windows(a: dict, b: dict) -> dict:
+    out = dict(a)
+    out["controls_seen"] = {cid: a["controls_seen"].get(cid, 0) + b["controls_seen"].get(cid, 0) for cid in CONTROLS}
+    for k in ("allow_count", "deny_count", "log_schema_ok", "log_schema_bad", "deletion_events"):
+        out[k] = a.get(k, 0) + b.get(k, 0)
+    sketches = [s for s in (a.get("lat_sketch"), b.get("lat_sketch")) if s]
+    out["lat_sketch"] = merge_all(sketches).to_dict() if sketches else None
+    return finalize(out)
+
+# Live per-window aggregation. Events land in the window of their `ts`; decision logs carry no
+# workload timestamp, so their schema checks count toward the window of arrival (the
+# summarizer does the same with time.time()). A window closes once the watermark - the newest
+# event ts, advanced by wall-clock time while idle, minus `lateness_sec` - passes its end;
+# closed windows are appended to <directory>/windows_<window_sec>[.<shard>].jsonl and events
+# for them are counted as late. Open windows are saved on shutdown and restored on start.
+class WindowAggregator:
+    def __init__(self, directory: Path, window_sec: int = 60, lateness_sec: float = 30.0, shard=None):
+        self.dir = Path(directory)
+        self.window_sec = window_sec
+        self.lateness_sec = lateness_sec
+        suffix = f".{shard}" if shard is not None else ""
+        self.path = self.dir / f"windows_{window_sec}{suffix}.jsonl"
+        self.open_path = self.dir / f"open_{window_sec}{suffix}.json"
+        self.open: dict[int, Window] = {}
+        self.closed_until = None
+        self._max_ts = None
+        self._last_arrival = time.monotonic()
+        self._pending: list[dict] = []
+        self.stats = {"events": 0, "decisions": 0, "late": 0, "closed": 0, "stale_windows": 0}
+
+    def start(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            with self.path.open("rb") as f:
+                for line in f:
+                    try:
+                        end = json.loads(line)["window_end"]
+                    except Exception:
+                        continue
+                    self.closed_until = end if self.closed_until is None else max(self.closed_until, end)
+        if self.open_path.exists():
+            try:
+                saved = json.loads(self.open_path.read_text(encoding="utf-8"))
+                self.open = {d["window_start"]: Window.from_dict(d, self.window_sec) for d in saved["windows"]}
+                self._max_ts = saved.get("max_ts")
+            except Exception:
+                self.open = {}
+
+    def _window(self, ts: float):
+        wstart = int(math.floor(ts / self.window_sec) * self.window_sec)
+        if self.closed_until is not None and wstart < self.closed_until:
+            self.stats["late"] += 1
+            return None
+        w = self.open.get(wstart)
+        if w is None:
+            w = self.open[wstart] = Window(wstart, self.window_sec)
+        return w
+
+    def observe_event(self, e):
+        if not isinstance(e, dict):
+            return
+        ts = e.get("ts")
+        ts = float(ts) if isinstance(ts, (int, float)) else time.time()
+        self.stats["events"] += 1
+        self._max_ts = ts if self._max_ts is None else max(self._max_ts, ts)
+        self._last_arrival = time.monotonic()
+        w = self._window(ts)
+        if w is not None:
+            w.add_event(e)
+
+    def observe_decision(self, d):
+        self.observe_decision_schema(*decision_schema_counts(d))
+
+    # for callers that parsed the decision earlier and commit it later
+    def observe_decision_schema(self, ok: int, bad: int):
+        self.stats["decisions"] += 1
+        w = self._window(time.time())
+        if w is not None:
+            w.schema_ok += ok
+            w.schema_bad += bad
+
+    def watermark(self):
+        if self._max_ts is None:
+            return None
+        return self._max_ts + (time.monotonic() - self._last_arrival) - self.lateness_sec
+
+    # close every open window whose end is at or before the watermark
+    def advance(self):
+        wm = self.watermark()
+        if wm is None:
+            return
+        for wstart in sorted(self.open):
+            w = self.open[wstart]
+            if w.end > wm:
+                break
+            d = w.to_dict()
+            del self.open[wstart]
+            self.closed_until = w.end if self.closed_until is None else max(self.closed_until, w.end)
+            self.stats["closed"] += 1
+            if d["missing_core_controls"]:
+                self.stats["stale_windows"] += 1
+            self._pending.append(d)
+
+    def drain(self) -> list[dict]:
+        pending, self._pending = self._pending, []
+        return pending
+
+    def persist(self, closed: list[dict]):
+        if not closed:
+            return
+        with self.path.open("a", encoding="utf-8") as f:
+            for d in closed:
+                f.write(json.dumps(d) + "\n")
+
+    def save_open(self):
+        tmp = self.open_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"max_ts": self._max_ts,
+                                   "windows": [w.to_dict() for w in self.open.values()]}), encoding="utf-8")
+        tmp.replace(self.open_path)
+
+    def current(self) -> list[dict]:
+        return [self.open[k].to_dict() for k in sorted(self.open)]
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "open": len(self.open), "closed_until": self.closed_until,
+                "watermark": self.watermark(), "window_sec": self.window_sec}
+
+# Closed windows in [t_from, t_to) from every worker's file, merged per window_start
+def query_windows(directory: Path, window_sec: int, t_from=None, t_to=None) -> list[dict]:
+    out: dict[int, dict] = {}
+    d = Path(directory)
+    for p in sorted([*d.glob(f"windows_{window_sec}.jsonl"), *d.glob(f"windows_{window_sec}.*.jsonl")]):
+        with p.open("rb") as f:
+            for line in f:
+                try:
+                    d = json.loads(line)
+                except Exception:
+                    continue
+                s = d["window_start"]
+                if (t_from is not None and d["window_end"] <= t_from) or (t_to is not None and s >= t_to):
+                    continue
+                out[s] = merge_windows(out[s], d) if s in out else d
+    return [out[k] for k in sorted(out)]
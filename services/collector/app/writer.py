@@ -0,0 +1,154 @@
+import asyncio, time
+from pathlib import Path
+
+from app.segments import FileSink
+
+FSYNC_POLICIES = ("none", "batch", "interval")
+_STOP = object()
+
+# Group-commit appender for one evidence stream. Handlers enqueue encoded records and
+# await a future; a single writer task gathers whatever is queued (up to max_records,
+# waiting at most flush_interval), appends it to the sink (one long-lived file, or
+# rotating segments) in a worker thread, and resolves the futures once the batch is
+# durable under the fsync policy:
+#   none     - written to the OS (flushed), no fsync
+#   batch    - fsync after every batch
+#   interval - fsync at most every fsync_interval seconds; acks wait for that fsync
+class StreamWriter:
+    def __init__(self, path: Path, flush_interval: float = 0.001, max_records: int = 1000,
+                 fsync: str = "none", fsync_interval: float = 1.0, max_queue: int = 100000, sink=None,
+                 chain=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.path = Path(path)
+        self.sink = sink if sink is not None else FileSink(self.path)
+        self.chain = chain
+        self.flush_interval = flush_interval
+        self.max_records = max_records
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_queue = max_queue
+        self.stats = {"records": 0, "batches": 0, "bytes": 0, "fsyncs": 0, "errors": 0}
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._unsynced: list[asyncio.Future] = []
+        self._last_sync = 0.0
+
+    async def start(self):
+        await asyncio.to_thread(self.sink.open)
+        if self.chain is not None:
+            # a pre-existing single file precedes any segments in the stream order
+            files = self.sink.files()
+            if self.path.exists() and self.path not in files:
+                files = [self.path] + files
+            await asyncio.to_thread(self.chain.recover, files)
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._last_sync = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        if self.chain is not None:
+            await asyncio.to_thread(lambda: self.chain.maybe_checkpoint(*self.sink.position(), force=True))
+        await asyncio.to_thread(self.sink.close)
+
+    # meta: one (ts, type, endpoints) tuple per record, used for segment manifests
+    async def append(self, data: bytes, records: int = 1, meta: list | None = None):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((data, records, meta if meta is not None else [(None, None, [])] * records, fut))
+        await fut
+
+    def snapshot(self) -> dict:
+        b = self.stats["batches"]
+        return {**self.stats, "queued": self._queue.qsize() if self._queue else 0,
+                "avg_batch_records": self.stats["records"] / b if b else None,
+                "fsync_policy": self.fsync, "path": str(getattr(self.sink, "path", self.path)),
+                "chain": self.chain.snapshot() if self.chain is not None else None}
+
+    def _sync_timeout(self):
+        if not self._unsynced:
+            return None
+        return max(0.0, self._last_sync + self.fsync_interval - time.monotonic())
+
+    async def _get(self, timeout):
+        if timeout is None:
+            return await self._queue.get()
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _run(self):
+        q = self._queue
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            first = await self._get(self._sync_timeout())
+            if first is None:
+                await self._commit([])
+                continue
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_records:
+                try:
+                    item = q.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    item = await self._get(remaining)
+                    if item is None:
+                        break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._commit(batch)
+        if self._unsynced:
+            await self._commit([], force_sync=True)
+
+    async def _commit(self, batch: list, force_sync: bool = False):
+        data = b"".join(d for d, _, _, _ in batch)
+        meta = [m for _, _, ms, _ in batch for m in ms]
+        sync = force_sync or self.fsync == "batch" or (
+            self.fsync == "interval" and time.monotonic() - self._last_sync >= self.fsync_interval)
+        futs = [f for _, _, _, f in batch]
+        try:
+            await asyncio.to_thread(self._write, data, meta, sync)
+        except Exception as ex:
+            self.stats["errors"] += 1
+            for f in futs + (self._unsynced if sync else []):
+                if not f.done():
+                    f.set_exception(ex)
+            if sync:
+                self._unsynced = []
+            return
+        if batch:
+            self.stats["records"] += sum(n for _, n, _, _ in batch)
+            self.stats["batches"] += 1
+            self.stats["bytes"] += len(data)
+        if self.fsync == "interval" and not sync:
+            self._unsynced.extend(futs)
+            return
+        if sync:
+            self._last_sync = time.monotonic()
+            futs += self._unsynced
+            self._unsynced = []
+        for f in futs:
+            if not f.done():
+                f.set_result(None)
+
+    def _write(self, data: bytes, meta: list, sync: bool):
+        self.sink.write(data, meta)
+        self.sink.flush(sync)
+        if sync:
+            self.stats["fsyncs"] += 1
+        if self.chain is not None:
+            self.chain.update(data)
+            self.chain.maybe_checkpoint(*self.sink.position())
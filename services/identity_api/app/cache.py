@@ -0,0 +1,117 @@
+import asyncio, json, time
+from collections import OrderedDict
+
+# Request fields compliance.authz actually reads; everything else (doc_*, ids, payloads) is ignored.
+POLICY_FIELDS = ("endpoint", "purpose", "requester_role", "retention_days", "risk_tier",
+                 "protocol", "vc_dm_version", "release_id", "environment_id")
+
+def decision_key(input_obj: dict) -> str:
+    req = input_obj.get("request", {})
+    proj = {k: req.get(k) for k in POLICY_FIELDS}
+    # the policy treats both lists as sets
+    proj["requested_claims"] = sorted(set(req.get("requested_claims") or []))
+    proj["log_fields"] = sorted(set(req.get("log_fields") or []))
+    return json.dumps(proj, sort_keys=True, separators=(",", ":"))
+
+# LRU + TTL cache of allow decisions, invalidated whenever the active bundle revision changes.
+class DecisionCache:
+    def __init__(self, max_entries: int = 4096, ttl_sec: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.revision: str | None = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0, "coalesced": 0}
+        self._entries: OrderedDict[str, tuple[bool, float]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def observe_revision(self, revision: str | None):
+        if revision is None or revision == self.revision:
+            return
+        if self.revision is not None:
+            self.stats["invalidations"] += 1
+        self._entries.clear()
+        self.revision = revision
+
+    def get(self, key: str) -> bool | None:
+        ent = self._entries.get(key)
+        if ent is None:
+            return None
+        allow, expires = ent
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.stats["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return allow
+
+    def put(self, key: str, allow: bool):
+        self._entries[key] = (allow, time.monotonic() + self.ttl_sec)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    # loader returns (allow, revision); concurrent misses on one key share a single PDP call
+    async def get_or_load(self, input_obj: dict, loader, timer=None) -> tuple[bool, bool]:
+        key = decision_key(input_obj)
+        allow = self.get(key)
+        if timer is not None:
+            timer.mark("cache")
+        if allow is not None:
+            self.stats["hits"] += 1
+            return allow, True
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(fut), True
+        self.stats["misses"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        rev_before = self.revision
+        try:
+            allow, revision = await loader(input_obj)
+            # skip caching if another path already moved the revision while we were loading
+            if self.revision == rev_before:
+                self.observe_revision(revision)
+                # nothing is cached before a revision is known: such entries could never be invalidated
+                if revision is not None and revision == self.revision:
+                    self.put(key, allow)
+            fut.set_result(allow)
+            return allow, False
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as ex:
+            fut.set_exception(ex)
+            fut.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    # batch variant: hits are served locally, all misses go to the loader in one call
+    async def get_or_load_many(self, inputs: list[dict], loader, timer=None) -> tuple[list[bool], list[bool]]:
+        keys = [decision_key(i) for i in inputs]
+        allows = [self.get(k) for k in keys]
+        if timer is not None:
+            timer.mark("cache")
+        miss = [i for i, a in enumerate(allows) if a is None]
+        self.stats["hits"] += len(inputs) - len(miss)
+        self.stats["misses"] += len(miss)
+        hits = [a is not None for a in allows]
+        if miss:
+            rev_before = self.revision
+            loaded, revision = await loader([inputs[i] for i in miss])
+            cacheable = False
+            if self.revision == rev_before:
+                self.observe_revision(revision)
+                cacheable = revision is not None and revision == self.revision
+            for i, a in zip(miss, loaded):
+                allows[i] = a
+                if cacheable:
+                    self.put(keys[i], a)
+        return allows, hits
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {**self.stats, "entries": len(self._entries), "max_entries": self.max_entries,
+                "ttl_sec": self.ttl_sec, "bundle_revision": self.revision,
+                "hit_rate": (self.stats["hits"] + self.stats["coalesced"]) / lookups if lookups else None}
@@ -0,0 +1,119 @@
+import asyncio, json, logging
+from pathlib import Path
+import httpx
+
+log = logging.getLogger("eviid.evidence")
+
+BATCH_PATH = "/event/batch"
+
+# Bounded evidence queue + background flusher (flush on batch size or elapsed time).
+# Overflow/failures are counted and failed batches are spooled when EVENT_SPOOL is set.
+class EventEmitter:
+    def __init__(self, base_url: str, max_queue: int = 10000, batch_size: int = 200,
+                 flush_interval: float = 0.25, max_retries: int = 3, timeout: float = 3.0,
+                 drain_timeout: float = 10.0, spool_path: str | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.drain_timeout = drain_timeout
+        self.spool_path = Path(spool_path) if spool_path else None
+        self.stats = {"enqueued": 0, "sent": 0, "batches": 0, "overflow": 0,
+                      "retries": 0, "failed": 0, "spooled": 0, "dropped": 0}
+        self._queue: asyncio.Queue | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    def emit(self, event: dict) -> bool:
+        if self._queue is None or self._stopping:
+            self.stats["dropped"] += 1
+            log.warning("evidence emitter not running; dropped event %s", event.get("decision_id"))
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats["overflow"] += 1
+            log.warning("evidence queue full (%d); dropped event %s", self.max_queue, event.get("decision_id"))
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "queued": self._queue.qsize() if self._queue else 0,
+                "max_queue": self.max_queue, "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval}
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._task, self.drain_timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            left = self._queue.qsize()
+            self.stats["dropped"] += left
+            log.warning("evidence drain timed out after %.1fs; %d events not flushed", self.drain_timeout, left)
+        self._task = None
+        await self._client.aclose()
+
+    async def _run(self):
+        q = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                while len(batch) < self.batch_size and not q.empty():
+                    batch.append(q.get_nowait())
+                if len(batch) >= self.batch_size or self._stopping:
+                    break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(q.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            if batch:
+                await self._send(batch)
+            elif self._stopping:
+                return
+
+    async def _send(self, batch: list[dict]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                r = await self._client.post(BATCH_PATH, json=batch)
+                r.raise_for_status()
+                self.stats["sent"] += len(batch)
+                self.stats["batches"] += 1
+                return
+            except Exception as ex:
+                if attempt < self.max_retries:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(min(0.1 * 2 ** attempt, 2.0))
+                else:
+                    log.warning("evidence batch of %d failed after %d attempts: %s", len(batch), attempt + 1, ex)
+        self.stats["failed"] += len(batch)
+        if self.spool_path is not None:
+            await asyncio.to_thread(self._spool, batch)
+
+    def _spool(self, batch: list[dict]):
+        try:
+            self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.spool_path.open("a", encoding="utf-8") as f:
+                for e in batch:
+                    f.write(json.dumps(e) + "\n")
+            self.stats["spooled"] += len(batch)
+        except Exception as ex:
+            self.stats["dropped"] += len(batch)
+            log.warning("evidence spool %s not writable: %s", self.spool_path, ex)
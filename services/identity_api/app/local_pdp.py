@@ -0,0 +1,212 @@
+import asyncio, io, json, logging, re, tarfile
+from pathlib import Path
+import httpx
+
+log = logging.getLogger("eviid.local_pdp")
+
+DATA_NAMES = ("required_log_fields", "allowed_purposes", "allowed_roles", "min_allowed_claims", "retention_limit_days")
+ASSIGN_RE = re.compile(r"^(\w+)\s*:?=\s*", re.M)
+TOKEN_RE = re.compile(r'\s*(?:(#[^\n]*)|("(?:[^"\\]|\\.)*")|(-?\d+(?:\.\d+)?)|(true|false|null)|([{}\[\],:]))')
+
+# Minimal reader for the Rego literals compliance.authz uses for its data
+# (strings, numbers, sets, objects, arrays). Sets become frozensets.
+def parse_rego_literal(src: str, pos: int = 0):
+    def tok(p):
+        while True:
+            m = TOKEN_RE.match(src, p)
+            if not m:
+                raise ValueError(f"unsupported Rego literal at offset {p}")
+            if m.group(1) is None:
+                return m, m.end()
+            p = m.end()
+
+    def value(p):
+        m, p = tok(p)
+        if m.group(2) is not None:
+            return json.loads(m.group(2)), p
+        if m.group(3) is not None:
+            return json.loads(m.group(3)), p
+        if m.group(4) is not None:
+            return json.loads(m.group(4)), p
+        c = m.group(5)
+        if c == "[":
+            items = []
+            m2, p2 = tok(p)
+            if m2.group(5) == "]":
+                return items, p2
+            while True:
+                v, p = value(p)
+                items.append(v)
+                m2, p = tok(p)
+                if m2.group(5) == "]":
+                    return items, p
+        if c == "{":
+            m2, p2 = tok(p)
+            if m2.group(5) == "}":
+                return frozenset(), p2
+            first, p = value(p)
+            m2, p = tok(p)
+            if m2.group(5) == ":":
+                obj = {}
+                v, p = value(p)
+                obj[first] = v
+                while True:
+                    m2, p = tok(p)
+                    if m2.group(5) == "}":
+                        return obj, p
+                    k, p = value(p)
+                    _, p = tok(p)
+                    v, p = value(p)
+                    obj[k] = v
+            items = {first}
+            while m2.group(5) != "}":
+                v, p = value(p)
+                items.add(v)
+                m2, p = tok(p)
+            return frozenset(items), p
+        raise ValueError(f"unexpected token {c!r} at offset {p}")
+
+    return value(pos)
+
+# `config` is the bundle's data.compliance.config document; names found there (values the
+# bundle builder moved out of the Rego source, e.g. retention_limit_days) take precedence
+def parse_policy_data(src: str, config: dict | None = None) -> dict:
+    data = {k: v for k, v in (config or {}).items() if k in DATA_NAMES}
+    for m in ASSIGN_RE.finditer(src):
+        name = m.group(1)
+        if name in DATA_NAMES and name not in data:
+            data[name], _ = parse_rego_literal(src, m.end())
+    missing = [n for n in DATA_NAMES if n not in data]
+    if missing:
+        raise ValueError(f"compliance.authz data missing from bundle: {missing}")
+    # high-complexity add-on from scripts/build_bundle.py
+    data["high_risk_deny"] = re.search(r"^high_risk_deny\s*\{", src, re.M) is not None
+    return data
+
+# Precomputed mirror of policies/rego/authz.rego (plus the optional high_risk_deny add-on).
+class LocalPolicy:
+    def __init__(self, data: dict, revision: str | None = None):
+        self.revision = revision
+        self.data = data
+        self.required_log_fields = frozenset(data["required_log_fields"])
+        self.allowed_purposes = frozenset(data["allowed_purposes"])
+        self.allowed_roles = {ep: frozenset(rs) for ep, rs in data["allowed_roles"].items()}
+        self.min_allowed_claims = frozenset(data["min_allowed_claims"])
+        self.retention_limit_days = data["retention_limit_days"]
+        self.high_risk_deny = bool(data.get("high_risk_deny"))
+
+    def allow(self, input_obj: dict) -> bool:
+        req = input_obj.get("request") or {}
+        ep = req.get("endpoint")
+        if self.high_risk_deny and not (req.get("risk_tier") == "high" and req.get("requester_role") != "compliance_service"):
+            # the add-on is a separate `allow { not high_risk_deny }` rule, i.e. OR-ed with the rest
+            return True
+        if req.get("purpose") not in self.allowed_purposes:
+            return False
+        if req.get("requester_role") not in self.allowed_roles.get(ep, ()):
+            return False
+        if not self.required_log_fields.issubset(req.get("log_fields") or ()):
+            return False
+        if ep == "onboarding/process":
+            rd = req.get("retention_days")
+            return isinstance(rd, (int, float)) and not isinstance(rd, bool) and rd <= self.retention_limit_days
+        if ep == "wallet/verify":
+            return (req.get("protocol") == "openid4vp" and req.get("vc_dm_version") == "2.0"
+                    and self.min_allowed_claims.issuperset(req.get("requested_claims") or ()))
+        return False
+
+CONFIG_FILE = "compliance/config/data.json"
+CONFIG_PREFIX = "/compliance/config/"
+
+# A snapshot bundle, or an OPA delta bundle (patch.json) applied on top of `base`
+def load_bundle(raw: bytes, base: LocalPolicy | None = None) -> LocalPolicy:
+    with tarfile.open(fileobj=io.BytesIO(raw), mode="r:gz") as tar:
+        files = {m.name[2:] if m.name.startswith("./") else m.name: m for m in tar.getmembers() if m.isfile()}
+        read = lambda name: tar.extractfile(files[name]).read()
+        manifest = json.loads(read(".manifest")) if ".manifest" in files else {}
+        if "patch.json" in files:
+            return apply_patch(base, json.loads(read("patch.json")), manifest.get("revision"))
+        src = read("policies/authz.rego").decode("utf-8")
+        config = json.loads(read(CONFIG_FILE)) if CONFIG_FILE in files else None
+    return LocalPolicy(parse_policy_data(src, config), revision=manifest.get("revision"))
+
+# Delta bundles from scripts/build_bundle.py only touch data.compliance.config
+def apply_patch(base: LocalPolicy | None, patch: dict, revision: str | None) -> LocalPolicy:
+    if base is None:
+        raise ValueError("delta bundle received before any snapshot bundle")
+    data = dict(base.data)
+    for op in patch.get("data", []):
+        path = op.get("path", "")
+        name = path[len(CONFIG_PREFIX):] if path.startswith(CONFIG_PREFIX) else None
+        if name not in DATA_NAMES:
+            raise ValueError(f"unsupported delta patch path {path!r}")
+        if op.get("op") in ("upsert", "replace"):
+            data[name] = op["value"]
+        else:
+            raise ValueError(f"unsupported delta patch op {op.get('op')!r} on {path}")
+    return LocalPolicy(data, revision=revision)
+
+# Loads the active bundle (file path or bundle-server URL) and reloads it when its bytes change.
+class LocalPDP:
+    def __init__(self, source: str, reload_sec: float = 2.0):
+        self.source = source
+        self.reload_sec = reload_sec
+        self.policy: LocalPolicy | None = None
+        # opa_routed: requests sent to OPA because no bundle was loaded yet (see policy_loaded)
+        self.stats = {"loads": 0, "load_errors": 0, "evaluations": 0, "opa_routed": 0}
+        self._etag: str | None = None
+        self._raw: bytes | None = None
+        self._client: httpx.AsyncClient | None = None
+
+    # one keep-alive client for every reload poll
+    async def start(self):
+        if self._client is None and self.source.startswith(("http://", "https://")):
+            self._client = httpx.AsyncClient(timeout=5.0)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self) -> bytes | None:
+        if self.source.startswith(("http://", "https://")):
+            if self._client is None:
+                await self.start()
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+            r = await self._client.get(self.source, headers=headers)
+            if r.status_code == 304:
+                return None
+            r.raise_for_status()
+            self._etag = r.headers.get("etag")
+            return r.content
+        return await asyncio.to_thread(Path(self.source).read_bytes)
+
+    async def refresh(self) -> bool:
+        try:
+            raw = await self.fetch()
+            if raw is None or raw == self._raw:
+                return False
+            self.policy = load_bundle(raw, self.policy)
+            self._raw = raw
+            self.stats["loads"] += 1
+            log.info("local PDP loaded bundle revision %s", self.policy.revision)
+            return True
+        except Exception as ex:
+            self.stats["load_errors"] += 1
+            log.warning("local PDP could not load %s: %s", self.source, ex)
+            return False
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.reload_sec)
+            await self.refresh()
+
+    def allow(self, input_obj: dict) -> bool:
+        if self.policy is None:
+            raise RuntimeError(f"local PDP has no bundle loaded from {self.source}")
+        self.stats["evaluations"] += 1
+        return self.policy.allow(input_obj)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "source": self.source, "policy_loaded": int(self.policy is not None),
+                "bundle_revision": self.policy.revision if self.policy else None}
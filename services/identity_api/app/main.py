@@ -1,6 +1,17 @@
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
-import os, time, uuid, requests
+from contextlib import asynccontextmanager
+import asyncio, logging, random
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+import os, time, uuid
+
+from app.cache import DecisionCache
+from app.evidence import EventEmitter
+from app.local_pdp import LocalPDP
+from app.metrics import StageHistograms, StageTimer, render_gauges
+from app.pdp import PDPClient
 
 OPA_URL = os.getenv("OPA_URL", "http://localhost:8181")
 COLLECTOR_URL = os.getenv("COLLECTOR_URL", "http://localhost:8081")
@@ -8,9 +19,92 @@ RELEASE_ID = os.getenv("RELEASE_ID", "r1")
 ENVIRONMENT_ID = os.getenv("ENVIRONMENT_ID", "dev")
 BASELINE_BYPASS = os.getenv("BASELINE_BYPASS", "0") == "1"
 
+OPA_POOL_SIZE = int(os.getenv("OPA_POOL_SIZE", "100"))
+OPA_POOL_KEEPALIVE = int(os.getenv("OPA_POOL_KEEPALIVE", str(OPA_POOL_SIZE)))
+OPA_KEEPALIVE_EXPIRY = float(os.getenv("OPA_KEEPALIVE_EXPIRY", "30"))
+OPA_CONNECT_TIMEOUT = float(os.getenv("OPA_CONNECT_TIMEOUT", "2"))
+OPA_TIMEOUT = float(os.getenv("OPA_TIMEOUT", "10"))
+OPA_POOL_TIMEOUT = float(os.getenv("OPA_POOL_TIMEOUT", "5"))
+
+EVENT_QUEUE_MAX = int(os.getenv("EVENT_QUEUE_MAX", "10000"))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "200"))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "0.25"))
+EVENT_MAX_RETRIES = int(os.getenv("EVENT_MAX_RETRIES", "3"))
+EVENT_TIMEOUT = float(os.getenv("EVENT_TIMEOUT", "3"))
+EVENT_DRAIN_TIMEOUT = float(os.getenv("EVENT_DRAIN_TIMEOUT", "10"))
+EVENT_SPOOL = os.getenv("EVENT_SPOOL") or None
+
+OPA_BUNDLE_NAME = os.getenv("OPA_BUNDLE_NAME", "identity")
+DECISION_CACHE = os.getenv("DECISION_CACHE", "0") == "1"
+DECISION_CACHE_SIZE = int(os.getenv("DECISION_CACHE_SIZE", "4096"))
+DECISION_CACHE_TTL = float(os.getenv("DECISION_CACHE_TTL", "30"))
+DECISION_CACHE_REVISION_POLL = float(os.getenv("DECISION_CACHE_REVISION_POLL", "1"))
+# OPA bundle status as reported to the bundle server (configs/opa_config.yaml `status:`); empty
+# disables the watcher, leaving revisions to decision provenance and the TTL
+BUNDLE_STATUS_URL = os.getenv("BUNDLE_STATUS_URL", "http://bundle-server/health")
+
+# opa: every decision goes to OPA; local: in-process evaluator over the active bundle;
+# shadow: local decisions, plus a sampled OPA re-check whose disagreements become evidence
+PDP_MODE = os.getenv("PDP_MODE", "opa")
+LOCAL_PDP_BUNDLE = os.getenv("LOCAL_PDP_BUNDLE", "http://bundle-server/bundle.tar.gz")
+LOCAL_PDP_RELOAD = float(os.getenv("LOCAL_PDP_RELOAD", "2"))
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.05"))
+
+log = logging.getLogger("eviid.identity_api")
+
 REQUIRED_LOG_FIELDS = ["control_id","policy_bundle_digest","release_id","environment_id","decision_id","timestamp"]
 
-app = FastAPI(title="EviID Identity API")
+pdp = PDPClient(OPA_URL, pool_size=OPA_POOL_SIZE, keepalive=OPA_POOL_KEEPALIVE,
+                keepalive_expiry=OPA_KEEPALIVE_EXPIRY, connect_timeout=OPA_CONNECT_TIMEOUT,
+                timeout=OPA_TIMEOUT, pool_timeout=OPA_POOL_TIMEOUT, bundle=OPA_BUNDLE_NAME)
+emitter = EventEmitter(COLLECTOR_URL, max_queue=EVENT_QUEUE_MAX, batch_size=EVENT_BATCH_SIZE,
+                       flush_interval=EVENT_FLUSH_INTERVAL, max_retries=EVENT_MAX_RETRIES,
+                       timeout=EVENT_TIMEOUT, drain_timeout=EVENT_DRAIN_TIMEOUT, spool_path=EVENT_SPOOL)
+cache = DecisionCache(max_entries=DECISION_CACHE_SIZE, ttl_sec=DECISION_CACHE_TTL) if DECISION_CACHE else None
+local_pdp = LocalPDP(LOCAL_PDP_BUNDLE, reload_sec=LOCAL_PDP_RELOAD) if PDP_MODE in ("local", "shadow") else None
+shadow_stats = {"checks": 0, "agree": 0, "disagree": 0, "revision_skew": 0, "errors": 0}
+background: set[asyncio.Task] = set()
+stage_hist = StageHistograms()
+
+# Cache hits never reach OPA, so watch the active bundle revision out of band: from OPA's
+# status reports, not a data query (every data query would land in the decision log)
+async def watch_bundle_revision():
+    async with httpx.AsyncClient(timeout=OPA_CONNECT_TIMEOUT + 1.0) as client:
+        while True:
+            try:
+                r = await client.get(BUNDLE_STATUS_URL)
+                r.raise_for_status()
+                cache.observe_revision(pdp.bundle_revision_of_status(r.json().get("opa") or {}, OPA_BUNDLE_NAME))
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                log.warning("bundle status poll failed: %s", ex)
+            await asyncio.sleep(DECISION_CACHE_REVISION_POLL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await pdp.start()
+    await emitter.start()
+    watchers = []
+    if cache is not None and BUNDLE_STATUS_URL and not BASELINE_BYPASS:
+        watchers.append(asyncio.create_task(watch_bundle_revision()))
+    if local_pdp is not None and not BASELINE_BYPASS:
+        await local_pdp.start()
+        await local_pdp.refresh()
+        watchers.append(asyncio.create_task(local_pdp.watch()))
+    try:
+        yield
+    finally:
+        for w in watchers:
+            w.cancel()
+        if background:
+            await asyncio.gather(*background, return_exceptions=True)
+        await emitter.close()
+        await pdp.close()
+        if local_pdp is not None:
+            await local_pdp.close()
+
+app = FastAPI(title="EviID Identity API", lifespan=lifespan)
 
 class OnboardingReq(BaseModel):
     requester_role: str = "onboarding_service"
@@ -35,19 +129,90 @@ class WalletReq(BaseModel):
 
 @app.get("/health")
 def health():
-    return {"ok": True, "release": RELEASE_ID, "env": ENVIRONMENT_ID, "baseline_bypass": BASELINE_BYPASS}
+    return {"ok": True, "release": RELEASE_ID, "env": ENVIRONMENT_ID, "baseline_bypass": BASELINE_BYPASS,
+            "evidence": emitter.snapshot(), "decision_cache": cache.snapshot() if cache is not None else None,
+            "pdp_mode": PDP_MODE, "local_pdp": local_pdp.snapshot() if local_pdp is not None else None,
+            "shadow": shadow_stats if PDP_MODE == "shadow" else None}
 
-def opa_allow(input_obj: dict) -> bool:
-    url = f"{OPA_URL}/v1/data/compliance/authz/allow"
-    r = requests.post(url, json={"input": input_obj}, timeout=10)
-    r.raise_for_status()
-    return bool(r.json().get("result", False))
+async def opa_allow(input_obj: dict) -> bool:
+    return await pdp.allow(input_obj)
 
-def emit_event(event: dict):
+def local_ready() -> bool:
+    if local_pdp is None:
+        return False
+    if local_pdp.policy is None:
+        local_pdp.stats["opa_routed"] += 1  # no bundle yet: this request goes to OPA
+        return False
+    return True
+
+def spawn(coro):
+    t = asyncio.create_task(coro)
+    background.add(t)
+    t.add_done_callback(background.discard)
+
+# Off the request path: re-ask OPA and record any disagreement with the local decisions as evidence
+async def shadow_check(inputs: list[dict], local_allows: list[bool], decision_ids: list[str]):
+    shadow_stats["checks"] += len(inputs)
+    local_rev = local_pdp.policy.revision
     try:
-        requests.post(f"{COLLECTOR_URL}/event", json=event, timeout=3)
-    except Exception:
-        pass
+        opa_allows, opa_rev = await pdp.decide_batch(inputs)
+    except Exception as ex:
+        shadow_stats["errors"] += len(inputs)
+        log.warning("shadow OPA check failed: %s", ex)
+        return
+    if opa_rev is not None and local_rev is not None and opa_rev != local_rev:
+        shadow_stats["revision_skew"] += len(inputs)
+        return
+    for inp, la, oa, decision_id in zip(inputs, local_allows, opa_allows, decision_ids):
+        if la == oa:
+            shadow_stats["agree"] += 1
+            continue
+        shadow_stats["disagree"] += 1
+        emit_event({"type":"pdp_shadow_disagreement","decision_id":decision_id,"local_allow":la,"opa_allow":oa,
+                    "bundle_revision":local_rev,"endpoint":inp["request"].get("endpoint"),"input":inp,
+                    "release_id":RELEASE_ID,"environment_id":ENVIRONMENT_ID,"ts":time.time()})
+
+def local_decide(inputs: list[dict], decision_ids: list[str]) -> list[bool]:
+    allows = [local_pdp.allow(i) for i in inputs]
+    if PDP_MODE == "shadow" and random.random() < SHADOW_SAMPLE_RATE:
+        spawn(shadow_check(inputs, allows, decision_ids))
+    return allows
+
+# -> (allow, cache status); cache status is None when the cache is disabled
+async def decide(input_obj: dict, decision_id: str, t: StageTimer) -> tuple[bool, str | None]:
+    if BASELINE_BYPASS:
+        return True, None
+    if local_ready():
+        allow = local_decide([input_obj], [decision_id])[0]
+        t.mark("pdp")
+        return allow, None
+    if cache is None:
+        allow = await opa_allow(input_obj)
+        t.mark("pdp")
+        return allow, None
+    allow, hit = await cache.get_or_load(input_obj, pdp.decide, timer=t)
+    t.mark("pdp")
+    return allow, "hit" if hit else "miss"
+
+async def decide_batch(inputs: list[dict], decision_ids: list[str], t: StageTimer) -> tuple[list[bool], list[str | None]]:
+    if BASELINE_BYPASS:
+        return [True] * len(inputs), [None] * len(inputs)
+    if not inputs:
+        return [], []
+    if local_ready():
+        allows = local_decide(inputs, decision_ids)
+        t.mark("pdp")
+        return allows, [None] * len(inputs)
+    if cache is None:
+        allows, _ = await pdp.decide_batch(inputs)
+        t.mark("pdp")
+        return allows, [None] * len(inputs)
+    allows, hits = await cache.get_or_load_many(inputs, pdp.decide_batch, timer=t)
+    t.mark("pdp")
+    return allows, ["hit" if h else "miss" for h in hits]
+
+def emit_event(event: dict):
+    emitter.emit(event)
 
 def envelope(endpoint: str, req: dict) -> dict:
     return {
@@ -70,26 +235,112 @@ def envelope(endpoint: str, req: dict) -> dict:
         }
     }
 
+ONBOARDING_ADAPTER = TypeAdapter(OnboardingReq)
+WALLET_ADAPTER = TypeAdapter(WalletReq)
+ONBOARDING_BATCH_ADAPTER = TypeAdapter(list[OnboardingReq])
+WALLET_BATCH_ADAPTER = TypeAdapter(list[WalletReq])
+
+# Bodies are validated here rather than by FastAPI so validation shows up as its own stage
+async def parse_body(req: Request, adapter: TypeAdapter, t: StageTimer):
+    body = await req.body()
+    t.mark("receive")
+    try:
+        parsed = adapter.validate_json(body)
+    except ValidationError as ex:
+        raise RequestValidationError(ex.errors(include_url=False))
+    t.mark("validate")
+    return parsed
+
 @app.post("/onboarding/process")
-def onboarding(r: OnboardingReq):
-    start = time.perf_counter()
+async def onboarding(req: Request):
+    t = StageTimer(stage_hist, "onboarding/process", RELEASE_ID)
+    r = await parse_body(req, ONBOARDING_ADAPTER, t)
+    start = t.t
     decision_id = str(uuid.uuid4())
     inp = envelope("onboarding/process", r.model_dump())
-    allow = True if BASELINE_BYPASS else opa_allow(inp)
+    t.mark("envelope")
+    allow, cached = await decide(inp, decision_id, t)
     dur_ms = (time.perf_counter() - start) * 1000.0
     emit_event({"type":"onboarding_decision","decision_id":decision_id,"allow":allow,"duration_ms":dur_ms,
                 "release_id":RELEASE_ID,"environment_id":ENVIRONMENT_ID,"ts":time.time(),
-                "doc_source": r.doc_source})
+                "doc_source": r.doc_source, "cache": cached, "bundle_revision": cache.revision if cached else None})
+    t.mark("evidence")
+    t.total()
     return {"decision_id": decision_id, "allow": allow, "duration_ms": dur_ms}
 
 @app.post("/wallet/verify")
-def wallet(r: WalletReq):
-    start = time.perf_counter()
+async def wallet(req: Request):
+    t = StageTimer(stage_hist, "wallet/verify", RELEASE_ID)
+    r = await parse_body(req, WALLET_ADAPTER, t)
+    start = t.t
     decision_id = str(uuid.uuid4())
     inp = envelope("wallet/verify", r.model_dump())
-    allow = True if BASELINE_BYPASS else opa_allow(inp)
+    t.mark("envelope")
+    allow, cached = await decide(inp, decision_id, t)
     dur_ms = (time.perf_counter() - start) * 1000.0
     emit_event({"type":"wallet_decision","decision_id":decision_id,"allow":allow,"duration_ms":dur_ms,
                 "release_id":RELEASE_ID,"environment_id":ENVIRONMENT_ID,"ts":time.time(),
-                "protocol": r.protocol, "vc_dm_version": r.vc_dm_version})
+                "protocol": r.protocol, "vc_dm_version": r.vc_dm_version,
+                "cache": cached, "bundle_revision": cache.revision if cached else None})
+    t.mark("evidence")
+    t.total()
     return {"decision_id": decision_id, "allow": allow, "duration_ms": dur_ms}
+
+# Batch endpoints: one OPA query (compliance.authz.batch_allow) for the whole array,
+# but every item keeps its own decision_id and evidence event.
+@app.post("/onboarding/process:batch")
+async def onboarding_batch(req: Request):
+    t = StageTimer(stage_hist, "onboarding/process:batch", RELEASE_ID)
+    rs = await parse_body(req, ONBOARDING_BATCH_ADAPTER, t)
+    start = t.t
+    batch_id = str(uuid.uuid4())
+    decision_ids = [str(uuid.uuid4()) for _ in rs]
+    inps = [envelope("onboarding/process", r.model_dump()) for r in rs]
+    t.mark("envelope")
+    allows, cached = await decide_batch(inps, decision_ids, t)
+    dur_ms = (time.perf_counter() - start) * 1000.0
+    ts = time.time()
+    for r, decision_id, allow, c in zip(rs, decision_ids, allows, cached):
+        emit_event({"type":"onboarding_decision","decision_id":decision_id,"allow":allow,"duration_ms":dur_ms,
+                    "release_id":RELEASE_ID,"environment_id":ENVIRONMENT_ID,"ts":ts,
+                    "doc_source": r.doc_source, "cache": c, "bundle_revision": cache.revision if c else None,
+                    "batch_id": batch_id, "batch_size": len(rs)})
+    t.mark("evidence")
+    t.total()
+    return {"batch_id": batch_id, "duration_ms": dur_ms,
+            "decisions": [{"decision_id": d, "allow": a} for d, a in zip(decision_ids, allows)]}
+
+@app.post("/wallet/verify:batch")
+async def wallet_batch(req: Request):
+    t = StageTimer(stage_hist, "wallet/verify:batch", RELEASE_ID)
+    rs = await parse_body(req, WALLET_BATCH_ADAPTER, t)
+    start = t.t
+    batch_id = str(uuid.uuid4())
+    decision_ids = [str(uuid.uuid4()) for _ in rs]
+    inps = [envelope("wallet/verify", r.model_dump()) for r in rs]
+    t.mark("envelope")
+    allows, cached = await decide_batch(inps, decision_ids, t)
+    dur_ms = (time.perf_counter() - start) * 1000.0
+    ts = time.time()
+    for r, decision_id, allow, c in zip(rs, decision_ids, allows, cached):
+        emit_event({"type":"wallet_decision","decision_id":decision_id,"allow":allow,"duration_ms":dur_ms,
+                    "release_id":RELEASE_ID,"environment_id":ENVIRONMENT_ID,"ts":ts,
+                    "protocol": r.protocol, "vc_dm_version": r.vc_dm_version,
+                    "cache": c, "bundle_revision": cache.revision if c else None,
+                    "batch_id": batch_id, "batch_size": len(rs)})
+    t.mark("evidence")
+    t.total()
+    return {"batch_id": batch_id, "duration_ms": dur_ms,
+            "decisions": [{"decision_id": d, "allow": a} for d, a in zip(decision_ids, allows)]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    out = stage_hist.render()
+    out += render_gauges("eviid_evidence", emitter.snapshot())
+    if cache is not None:
+        out += render_gauges("eviid_decision_cache", cache.snapshot())
+    if local_pdp is not None:
+        out += render_gauges("eviid_local_pdp", local_pdp.snapshot())
+    if PDP_MODE == "shadow":
+        out += render_gauges("eviid_shadow", shadow_stats)
+    return out
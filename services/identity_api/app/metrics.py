@@ -0,0 +1,60 @@
+import time
+from bisect import bisect_left
+
+# Upper bounds in ms; the final +Inf bucket is implicit.
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Fixed-bucket histograms keyed by (endpoint, release_id, stage). Observing is one
+# bisect plus two adds, so it is cheap enough for the request hot path.
+class StageHistograms:
+    def __init__(self, buckets_ms=BUCKETS_MS):
+        self.buckets = tuple(buckets_ms)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, endpoint: str, release_id: str, stage: str, ms: float):
+        key = (endpoint, release_id, stage)
+        s = self._series.get(key)
+        if s is None:
+            s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        s[0][bisect_left(self.buckets, ms)] += 1
+        s[1] += ms
+        s[2] += 1
+
+    def render(self, name: str = "eviid_stage_duration_ms") -> str:
+        lines = [f"# HELP {name} Per-stage request latency in milliseconds.", f"# TYPE {name} histogram"]
+        for (endpoint, release_id, stage), (counts, total, n) in sorted(self._series.items()):
+            labels = f'endpoint="{endpoint}",release_id="{release_id}",stage="{stage}"'
+            cum = 0
+            for le, c in zip(self.buckets, counts):
+                cum += c
+                lines.append(f'{name}_bucket{{{labels},le="{le:g}"}} {cum}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cum + counts[-1]}')
+            lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {n}")
+        return "\n".join(lines) + "\n"
+
+# Records the time since the previous mark under the given stage name.
+class StageTimer:
+    __slots__ = ("hist", "endpoint", "release_id", "t0", "t")
+
+    def __init__(self, hist: StageHistograms, endpoint: str, release_id: str):
+        self.hist = hist
+        self.endpoint = endpoint
+        self.release_id = release_id
+        self.t0 = self.t = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.hist.observe(self.endpoint, self.release_id, stage, (now - self.t) * 1000.0)
+        self.t = now
+
+    def total(self):
+        self.hist.observe(self.endpoint, self.release_id, "total", (time.perf_counter() - self.t0) * 1000.0)
+
+def render_gauges(prefix: str, stats: dict, labels: str = "") -> str:
+    lines = []
+    for k, v in sorted(stats.items()):
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            continue
+        lines.append(f"{prefix}_{k}{{{labels}}} {v}" if labels else f"{prefix}_{k} {v}")
+    return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,71 @@
+import httpx
+
+ALLOW_PATH = "/v1/data/compliance/authz/allow"
+BATCH_ALLOW_PATH = "/v1/data/compliance/authz/batch_allow"
+
+# Shared async OPA client: one pooled set of keep-alive connections per process
+class PDPClient:
+    def __init__(self, base_url: str, pool_size: int = 100, keepalive: int = 100,
+                 keepalive_expiry: float = 30.0, connect_timeout: float = 2.0,
+                 timeout: float = 10.0, pool_timeout: float = 5.0, bundle: str | None = "identity"):
+        self.base_url = base_url.rstrip("/")
+        self.bundle = bundle
+        self.limits = httpx.Limits(max_connections=pool_size,
+                                   max_keepalive_connections=keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout, pool=pool_timeout)
+        self._client: httpx.AsyncClient | None = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, limits=self.limits, timeout=self.timeout)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def query(self, path: str, input_obj: dict, provenance: bool = False) -> dict:
+        if self._client is None:
+            await self.start()
+        params = {"provenance": "true"} if provenance else None
+        r = await self._client.post(path, json={"input": input_obj}, params=params)
+        r.raise_for_status()
+        return r.json()
+
+    async def allow(self, input_obj: dict) -> bool:
+        return bool((await self.query(ALLOW_PATH, input_obj)).get("result", False))
+
+    # allow decision plus the bundle revision it was evaluated against
+    async def decide(self, input_obj: dict) -> tuple[bool, str | None]:
+        res = await self.query(ALLOW_PATH, input_obj, provenance=True)
+        return bool(res.get("result", False)), self.bundle_revision_of(res, self.bundle)
+
+    # one OPA query for many envelopes; returns per-item decisions in input order
+    async def decide_batch(self, inputs: list[dict]) -> tuple[list[bool], str | None]:
+        res = await self.query(BATCH_ALLOW_PATH, {"requests": [i["request"] for i in inputs]}, provenance=True)
+        by_idx = res.get("result") or {}
+        if isinstance(by_idx, list):
+            by_idx = dict(enumerate(by_idx))
+        elif not isinstance(by_idx, dict):
+            by_idx = {}
+        allows = [bool(by_idx.get(str(i), by_idx.get(i, False))) for i in range(len(inputs))]
+        return allows, self.bundle_revision_of(res, self.bundle)
+
+    @staticmethod
+    def bundle_revision_of(res: dict, bundle: str | None) -> str | None:
+        bundles = (res.get("provenance") or {}).get("bundles") or {}
+        if bundle and bundle in bundles:
+            return bundles[bundle].get("revision")
+        revs = sorted(str(b.get("revision")) for b in bundles.values() if isinstance(b, dict))
+        return ",".join(revs) or None
+
+    # active revision from OPA's bundle status reports ({bundle: {"active_revision", ...}}, as
+    # relayed by the bundle server); reading them never touches the data API, so no decision logs
+    @staticmethod
+    def bundle_revision_of_status(bundles: dict, bundle: str | None) -> str | None:
+        if bundle and bundle in bundles:
+            return (bundles[bundle] or {}).get("active_revision")
+        revs = sorted(str(b.get("active_revision")) for b in bundles.values()
+                      if isinstance(b, dict) and b.get("active_revision") is not None)
+        return ",".join(revs) or None
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "services" / "collector"))
+sys.path.insert(0, str(ROOT))
+
+from app.chain import HashChain
+from scripts.lib.chain import GENESIS, chain_step
+
+def verifier_root(data: bytes) -> tuple[str, int]:
+    root, n = GENESIS, 0
+    for line in data.split(b"\n")[:-1]:
+        root, n = chain_step(root, line + b"\n"), n + 1
+    return root, n
+
+def test_embedded_carriage_return_is_record_content(tmp_path):
+    data = b'{"a":"x\rb"}\n{"b":1}\n'
+    chain = HashChain("s", tmp_path)
+    chain.update(data)
+    assert chain.records == 2
+    assert (chain.root, chain.records) == verifier_root(data)
+
+def test_records_split_across_updates(tmp_path):
+    data = b'{"a":1}\n{"b":"y\r\nz"}\n{"c":3}\n'
+    chain = HashChain("s", tmp_path)
+    for i in range(0, len(data), 5):
+        chain.update(data[i:i + 5])
+    assert (chain.root, chain.records) == verifier_root(data)
+    assert chain.bytes == len(data)